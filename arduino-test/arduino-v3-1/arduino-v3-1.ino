@@ -0,0 +1,259 @@
+// Protocol Version: 3.1 - Scheduled beats and clock sync
+
+// LED controller with automatic decay, BPM-aware timing and
+// beats scheduled ahead of time on the device clock.
+//
+// Commands (one per line, terminated with '\n'):
+//   "B:brightness:bpm"           - set brightness now (same as v3.0)
+//   "F:device_ms:brightness:bpm" - set brightness when millis() reaches device_ms
+//   "S:seq"                      - clock sync ping, replies "S:seq:millis"
+//   "R:1" / "R:0"                - enable / disable timing reports
+//
+// Timing reports (only when enabled with "R:1"):
+//   "A:millis"         - an immediate "B:" command was applied
+//   "F:target:millis"  - a scheduled command fired
+//   "D:target"         - a scheduled command was dropped (queue full)
+
+#define LED_PIN 9 // PWM-capable pin
+#define DEBUG 0   // Set to 1 to enable debug, 0 to disable
+
+// Decay parameters
+#define DECAY_DELAY 15  // Milliseconds between decay steps
+#define MIN_THRESHOLD 5 // Minimum PWM value before turning off
+
+// Dynamic decay parameters
+#define MIN_DECAY_RATE 0.35     // Fast decay (for fast music)
+#define MAX_DECAY_RATE 0.94     // Slow decay (for slow music)
+#define DEFAULT_DECAY_RATE 0.75 // Default when no BPM is available
+
+// Scheduling parameters
+#define SCHEDULE_SIZE 8 // Maximum pending scheduled beats
+
+struct ScheduledBeat
+{
+  unsigned long fireAt; // Device time (millis) to fire at
+  float brightness;
+  int bpm;
+  bool pending;
+};
+
+float currentBrightness = 0.0;   // Current LED brightness (0.0-1.0)
+unsigned long lastDecayTime = 0; // Time of last decay
+float decayRate = DEFAULT_DECAY_RATE;
+int currentBPM = 120; // Default BPM
+bool timingReports = false;
+
+ScheduledBeat schedule[SCHEDULE_SIZE];
+
+void setup()
+{
+  pinMode(LED_PIN, OUTPUT);
+  analogWrite(LED_PIN, 0); // Make sure LED starts off
+
+  // Initialize serial with maximum speed
+  Serial.begin(250000);
+  Serial.setTimeout(10);
+}
+
+void loop()
+{
+  // Fire anything that is due before reading new input
+  handleSchedule();
+
+  // Check for new serial data
+  if (Serial.available() > 0)
+  {
+    // Scheduled commands may arrive back to back, so handle one line per
+    // loop and leave the rest in the buffer instead of discarding it
+    String rawInput = Serial.readStringUntil('\n');
+
+    if (rawInput.startsWith("B:"))
+    {
+      handleImmediate(rawInput);
+    }
+    else if (rawInput.startsWith("F:"))
+    {
+      handleScheduled(rawInput);
+    }
+    else if (rawInput.startsWith("S:"))
+    {
+      // Reply as fast as possible - the host measures the round trip
+      unsigned long now = millis();
+      Serial.print("S:");
+      Serial.print(rawInput.substring(2));
+      Serial.print(':');
+      Serial.println(now);
+    }
+    else if (rawInput.startsWith("R:"))
+    {
+      timingReports = rawInput.substring(2).toInt() != 0;
+    }
+  }
+
+  handleSchedule();
+
+  // Apply decay with the dynamically calculated rate
+  handleDecay();
+}
+
+// "B:brightness:bpm" - apply immediately
+void handleImmediate(String &rawInput)
+{
+  int firstColon = rawInput.indexOf(':');
+  int secondColon = rawInput.indexOf(':', firstColon + 1);
+
+  if (firstColon < 0 || secondColon < 0)
+  {
+    return;
+  }
+
+  float value = rawInput.substring(firstColon + 1, secondColon).toFloat();
+  int bpm = rawInput.substring(secondColon + 1).toInt();
+
+  if (value >= 0.0 && value <= 1.0 && bpm > 0)
+  {
+    applyBeat(value, bpm);
+
+    if (timingReports)
+    {
+      Serial.print("A:");
+      Serial.println(millis());
+    }
+  }
+}
+
+// "F:device_ms:brightness:bpm" - queue for later
+void handleScheduled(String &rawInput)
+{
+  int firstColon = rawInput.indexOf(':');
+  int secondColon = rawInput.indexOf(':', firstColon + 1);
+  int thirdColon = rawInput.indexOf(':', secondColon + 1);
+
+  if (firstColon < 0 || secondColon < 0 || thirdColon < 0)
+  {
+    return;
+  }
+
+  unsigned long fireAt = strtoul(rawInput.substring(firstColon + 1, secondColon).c_str(), NULL, 10);
+  float value = rawInput.substring(secondColon + 1, thirdColon).toFloat();
+  int bpm = rawInput.substring(thirdColon + 1).toInt();
+
+  if (value < 0.0 || value > 1.0)
+  {
+    return;
+  }
+
+  for (int i = 0; i < SCHEDULE_SIZE; i++)
+  {
+    if (!schedule[i].pending)
+    {
+      schedule[i].fireAt = fireAt;
+      schedule[i].brightness = value;
+      schedule[i].bpm = bpm;
+      schedule[i].pending = true;
+      return;
+    }
+  }
+
+  if (timingReports)
+  {
+    Serial.print("D:");
+    Serial.println(fireAt);
+  }
+}
+
+// Fire every scheduled beat whose time has come
+void handleSchedule()
+{
+  unsigned long now = millis();
+
+  for (int i = 0; i < SCHEDULE_SIZE; i++)
+  {
+    // Signed difference keeps this correct across the millis() rollover
+    if (schedule[i].pending && (long)(now - schedule[i].fireAt) >= 0)
+    {
+      schedule[i].pending = false;
+      applyBeat(schedule[i].brightness, schedule[i].bpm);
+
+      if (timingReports)
+      {
+        Serial.print("F:");
+        Serial.print(schedule[i].fireAt);
+        Serial.print(':');
+        Serial.println(now);
+      }
+    }
+  }
+}
+
+// Set brightness and BPM-dependent decay rate
+void applyBeat(float value, int bpm)
+{
+  currentBrightness = value;
+
+  // Calculate appropriate decay rate based on BPM
+  // Faster music (higher BPM) = faster decay
+  if (bpm > 0)
+  {
+    currentBPM = bpm;
+    // Map BPM range (60-180) to decay range (MAX_DECAY_RATE to MIN_DECAY_RATE)
+    // Constrain BPM to avoid extreme values
+    int constrainedBPM = constrain(bpm, 60, 180);
+    decayRate = map(constrainedBPM, 60, 180, MAX_DECAY_RATE * 100, MIN_DECAY_RATE * 100) / 100.0;
+  }
+
+  updateLED();
+
+#if DEBUG
+  Serial.print("New brightness: ");
+  Serial.print(currentBrightness);
+  Serial.print(", BPM: ");
+  Serial.print(currentBPM);
+  Serial.print(", Decay Rate: ");
+  Serial.println(decayRate, 3);
+#endif
+}
+
+// Apply decay effect with dynamic decay rate
+void handleDecay()
+{
+  unsigned long currentTime = millis();
+
+  // Check if it's time to apply decay
+  if (currentTime - lastDecayTime >= DECAY_DELAY && currentBrightness > 0)
+  {
+    lastDecayTime = currentTime;
+
+    // Apply exponential decay with dynamically set rate
+    currentBrightness *= decayRate;
+
+    // If brightness is very low, turn off completely
+    if (currentBrightness * 255 < MIN_THRESHOLD)
+    {
+      currentBrightness = 0;
+    }
+
+    // Update the LED with the new value
+    updateLED();
+
+#if DEBUG
+    if (currentBrightness > 0)
+    {
+      Serial.print("Decay: ");
+      Serial.println(currentBrightness);
+    }
+#endif
+  }
+}
+
+// Apply gamma correction and update the LED
+void updateLED()
+{
+  // Apply gamma correction for more natural brightness perception
+  float gamma = 2.8;
+  float correctedBrightness = pow(currentBrightness, 1.0 / gamma);
+
+  // Convert to PWM range (0-255)
+  int pwmValue = int(correctedBrightness * 255.0);
+  analogWrite(LED_PIN, pwmValue);
+}
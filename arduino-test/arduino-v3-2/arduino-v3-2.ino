@@ -0,0 +1,541 @@
+// Protocol Version: 3.2 - Allocation-free fixed-point loop
+
+// Same commands and LED behaviour as v3.1, rebuilt so the loop never blocks
+// or touches the heap and can keep up with much higher host update rates:
+//   - input is parsed from a fixed line buffer as bytes arrive (no String,
+//     no readStringUntil timeout)
+//   - brightness and decay are 16-bit fixed point, stepped by a millis()
+//     task scheduler instead of float math
+//   - gamma correction is a precomputed table in flash
+//
+// Commands (one per line, terminated with '\n'):
+//   "B:brightness:bpm"           - set brightness now
+//   "F:device_ms:brightness:bpm" - set brightness when millis() reaches device_ms
+//   "S:seq"                      - clock sync ping, replies "S:seq:millis"
+//   "R:1" / "R:0"                - enable / disable timing reports
+//   "I"                          - report loop and input statistics
+//
+// Timing reports (only when enabled with "R:1"):
+//   "A:millis"         - an immediate "B:" command was applied
+//   "F:target:millis"  - a scheduled command fired
+//   "D:target"         - a scheduled command was dropped (queue full)
+//
+// Statistics reply to "I":
+//   "I:loops_per_sec:dropped_bytes:bad_lines:rx_full:schedule_full"
+//     loops_per_sec  - loop() iterations in the last full second
+//     dropped_bytes  - bytes discarded from lines longer than LINE_SIZE
+//     bad_lines      - unknown or malformed commands
+//     rx_full        - times the serial receive buffer was found full
+//                      (the UART may have lost bytes)
+//     schedule_full  - scheduled commands dropped because the queue was full
+
+#include <avr/pgmspace.h>
+
+#define LED_PIN 9 // PWM-capable pin
+#define DEBUG 0   // Set to 1 to enable debug, 0 to disable
+
+// Brightness is 0..LEVEL_MAX, decay rates are multipliers in 1/65536ths
+#define LEVEL_MAX 65535U
+#define Q16(x) ((uint16_t)((x) * 65536.0 + 0.5))
+
+// Decay parameters
+#define DECAY_DELAY 15  // Milliseconds between decay steps
+#define MIN_THRESHOLD 5 // Minimum PWM value before turning off
+
+// Dynamic decay parameters
+#define MIN_DECAY_PERCENT 35         // Fast decay (for fast music)
+#define MAX_DECAY_PERCENT 94         // Slow decay (for slow music)
+#define DEFAULT_DECAY_RATE Q16(0.75) // Default when no BPM is available
+
+// Scheduling parameters
+#define SCHEDULE_SIZE 8 // Maximum pending scheduled beats
+
+// Input parameters
+#define LINE_SIZE 40 // Longest accepted command, e.g. "F:4294967295:1.000:180"
+#ifdef SERIAL_RX_BUFFER_SIZE
+#define RX_CAPACITY (SERIAL_RX_BUFFER_SIZE - 1)
+#else
+#define RX_CAPACITY 63
+#endif
+
+// 255 * (level / LEVEL_MAX) ^ (1 / 2.8) at every 256th level, the curve v3.1
+// computed with pow(). updateLED() interpolates between entries
+const uint8_t GAMMA_TABLE[257] PROGMEM = {
+    0, 35, 45, 52, 58, 63, 67, 71, 74, 77, 80, 83, 85, 88, 90, 93,
+    95, 97, 99, 101, 103, 104, 106, 108, 109, 111, 113, 114, 116, 117, 119, 120,
+    121, 123, 124, 125, 127, 128, 129, 130, 131, 133, 134, 135, 136, 137, 138, 139,
+    140, 141, 142, 143, 144, 145, 146, 147, 148, 149, 150, 151, 152, 153, 154, 155,
+    155, 156, 157, 158, 159, 160, 160, 161, 162, 163, 164, 164, 165, 166, 167, 168,
+    168, 169, 170, 171, 171, 172, 173, 173, 174, 175, 176, 176, 177, 178, 178, 179,
+    180, 180, 181, 182, 182, 183, 184, 184, 185, 185, 186, 187, 187, 188, 189, 189,
+    190, 190, 191, 192, 192, 193, 193, 194, 195, 195, 196, 196, 197, 197, 198, 199,
+    199, 200, 200, 201, 201, 202, 202, 203, 203, 204, 205, 205, 206, 206, 207, 207,
+    208, 208, 209, 209, 210, 210, 211, 211, 212, 212, 213, 213, 214, 214, 215, 215,
+    216, 216, 217, 217, 218, 218, 218, 219, 219, 220, 220, 221, 221, 222, 222, 223,
+    223, 224, 224, 224, 225, 225, 226, 226, 227, 227, 228, 228, 228, 229, 229, 230,
+    230, 231, 231, 231, 232, 232, 233, 233, 233, 234, 234, 235, 235, 236, 236, 236,
+    237, 237, 238, 238, 238, 239, 239, 240, 240, 240, 241, 241, 242, 242, 242, 243,
+    243, 244, 244, 244, 245, 245, 245, 246, 246, 247, 247, 247, 248, 248, 248, 249,
+    249, 250, 250, 250, 251, 251, 251, 252, 252, 252, 253, 253, 254, 254, 254, 255,
+    255,
+};
+
+// The same curve at every level below 256, where it is too steep to
+// interpolate between GAMMA_TABLE entries
+const uint8_t LOW_GAMMA_TABLE[256] PROGMEM = {
+    0, 5, 6, 7, 8, 9, 9, 10, 10, 11, 11, 11, 12, 12, 12, 13,
+    13, 13, 14, 14, 14, 14, 15, 15, 15, 15, 16, 16, 16, 16, 16, 17,
+    17, 17, 17, 17, 17, 18, 18, 18, 18, 18, 18, 19, 19, 19, 19, 19,
+    19, 19, 20, 20, 20, 20, 20, 20, 20, 21, 21, 21, 21, 21, 21, 21,
+    21, 22, 22, 22, 22, 22, 22, 22, 22, 22, 23, 23, 23, 23, 23, 23,
+    23, 23, 23, 24, 24, 24, 24, 24, 24, 24, 24, 24, 24, 25, 25, 25,
+    25, 25, 25, 25, 25, 25, 25, 25, 26, 26, 26, 26, 26, 26, 26, 26,
+    26, 26, 26, 26, 27, 27, 27, 27, 27, 27, 27, 27, 27, 27, 27, 27,
+    27, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 29, 29,
+    29, 29, 29, 29, 29, 29, 29, 29, 29, 29, 29, 29, 29, 30, 30, 30,
+    30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 31, 31, 31, 31,
+    31, 31, 31, 31, 31, 31, 31, 31, 31, 31, 31, 31, 32, 32, 32, 32,
+    32, 32, 32, 32, 32, 32, 32, 32, 32, 32, 32, 32, 32, 33, 33, 33,
+    33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 33, 34,
+    34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34,
+    34, 34, 34, 35, 35, 35, 35, 35, 35, 35, 35, 35, 35, 35, 35, 35,
+};
+
+struct ScheduledBeat
+{
+  unsigned long fireAt; // Device time (millis) to fire at
+  uint16_t level;
+  int bpm;
+  bool pending;
+};
+
+// Periodic work run from loop() on millis() deadlines
+struct Task
+{
+  unsigned long due;      // Next run (millis)
+  unsigned int period;    // Milliseconds between runs
+  void (*run)();
+};
+
+void decayStep();
+void latchStats();
+
+enum
+{
+  TASK_DECAY,
+  TASK_STATS,
+  TASK_COUNT
+};
+
+Task tasks[TASK_COUNT] = {
+    {0, DECAY_DELAY, decayStep},
+    {0, 1000, latchStats},
+};
+
+uint16_t currentLevel = 0; // Current LED brightness (0-LEVEL_MAX)
+uint16_t decayRate = DEFAULT_DECAY_RATE;
+int currentBPM = 120; // Default BPM
+bool timingReports = false;
+
+ScheduledBeat schedule[SCHEDULE_SIZE];
+
+// Line being received
+char line[LINE_SIZE + 1];
+uint8_t lineLength = 0;
+bool lineOverflow = false; // Discarding the rest of a too-long line
+
+// Statistics for "I"
+unsigned long loopCount = 0;
+unsigned long loopsPerSecond = 0;
+unsigned long droppedBytes = 0;
+unsigned long badLines = 0;
+unsigned long rxFull = 0;
+unsigned long scheduleFull = 0;
+
+void setup()
+{
+  pinMode(LED_PIN, OUTPUT);
+  analogWrite(LED_PIN, 0); // Make sure LED starts off
+
+  // Initialize serial with maximum speed
+  Serial.begin(250000);
+
+  unsigned long now = millis();
+  for (uint8_t i = 0; i < TASK_COUNT; i++)
+  {
+    tasks[i].due = now + tasks[i].period;
+  }
+}
+
+void loop()
+{
+  loopCount++;
+
+  // Fire anything that is due before reading new input
+  handleSchedule();
+
+  readInput();
+
+  handleSchedule();
+
+  runTasks();
+}
+
+// Feed every byte that has arrived into the line buffer, dispatching
+// complete lines. Never waits for more input.
+void readInput()
+{
+  int available = Serial.available();
+  if (available >= RX_CAPACITY)
+  {
+    rxFull++;
+  }
+
+  while (available-- > 0)
+  {
+    char c = Serial.read();
+
+    if (c == '\n')
+    {
+      if (!lineOverflow)
+      {
+        line[lineLength] = '\0';
+        handleLine();
+      }
+      lineLength = 0;
+      lineOverflow = false;
+    }
+    else if (c == '\r')
+    {
+      continue;
+    }
+    else if (lineOverflow || lineLength >= LINE_SIZE)
+    {
+      if (!lineOverflow)
+      {
+        droppedBytes += lineLength; // The part already buffered is lost too
+        badLines++;
+        lineOverflow = true;
+      }
+      droppedBytes++;
+    }
+    else
+    {
+      line[lineLength++] = c;
+    }
+  }
+}
+
+void handleLine()
+{
+  if (lineLength == 0)
+  {
+    return;
+  }
+
+  bool ok;
+  switch (line[0])
+  {
+  case 'B':
+    ok = handleImmediate(line + 1);
+    break;
+  case 'F':
+    ok = handleScheduled(line + 1);
+    break;
+  case 'S':
+    // Reply as fast as possible - the host measures the round trip
+    ok = line[1] == ':';
+    if (ok)
+    {
+      unsigned long now = millis();
+      Serial.print("S:");
+      Serial.print(line + 2);
+      Serial.print(':');
+      Serial.println(now);
+    }
+    break;
+  case 'R':
+    ok = line[1] == ':' && (line[2] == '0' || line[2] == '1') && line[3] == '\0';
+    if (ok)
+    {
+      timingReports = line[2] == '1';
+    }
+    break;
+  case 'I':
+    ok = line[1] == '\0';
+    if (ok)
+    {
+      reportStats();
+    }
+    break;
+  default:
+    ok = false;
+  }
+
+  if (!ok)
+  {
+    badLines++;
+  }
+}
+
+// ":digits" -> value. Advances p past the digits.
+bool parseUnsigned(const char *&p, unsigned long &value)
+{
+  if (*p++ != ':' || *p < '0' || *p > '9')
+  {
+    return false;
+  }
+
+  value = 0;
+  while (*p >= '0' && *p <= '9')
+  {
+    value = value * 10 + (*p++ - '0');
+  }
+  return true;
+}
+
+// ":0.75" / ":1" / ":.5" -> 0..LEVEL_MAX. Rejects anything above 1.0.
+bool parseLevel(const char *&p, uint16_t &level)
+{
+  if (*p++ != ':')
+  {
+    return false;
+  }
+
+  uint8_t whole = 0;
+  unsigned long fraction = 0;
+  unsigned long scale = 1;
+  bool digits = false;
+
+  while (*p >= '0' && *p <= '9')
+  {
+    whole = whole * 10 + (*p++ - '0');
+    if (whole > 1)
+    {
+      return false;
+    }
+    digits = true;
+  }
+
+  if (*p == '.')
+  {
+    p++;
+    while (*p >= '0' && *p <= '9')
+    {
+      // Four decimals is finer than LEVEL_MAX steps anyway
+      if (scale < 10000)
+      {
+        fraction = fraction * 10 + (*p - '0');
+        scale *= 10;
+      }
+      p++;
+      digits = true;
+    }
+  }
+
+  unsigned long value = whole * (unsigned long)LEVEL_MAX + (fraction * LEVEL_MAX + scale / 2) / scale;
+  if (!digits || value > LEVEL_MAX)
+  {
+    return false;
+  }
+
+  level = value;
+  return true;
+}
+
+// ":brightness:bpm" - apply immediately
+bool handleImmediate(const char *p)
+{
+  uint16_t level;
+  unsigned long bpm;
+
+  if (!parseLevel(p, level) || !parseUnsigned(p, bpm) || *p != '\0' || bpm == 0)
+  {
+    return false;
+  }
+
+  applyBeat(level, bpm);
+
+  if (timingReports)
+  {
+    Serial.print("A:");
+    Serial.println(millis());
+  }
+  return true;
+}
+
+// ":device_ms:brightness:bpm" - queue for later
+bool handleScheduled(const char *p)
+{
+  unsigned long fireAt;
+  uint16_t level;
+  unsigned long bpm;
+
+  if (!parseUnsigned(p, fireAt) || !parseLevel(p, level) || !parseUnsigned(p, bpm) || *p != '\0')
+  {
+    return false;
+  }
+
+  for (uint8_t i = 0; i < SCHEDULE_SIZE; i++)
+  {
+    if (!schedule[i].pending)
+    {
+      schedule[i].fireAt = fireAt;
+      schedule[i].level = level;
+      schedule[i].bpm = bpm;
+      schedule[i].pending = true;
+      return true;
+    }
+  }
+
+  scheduleFull++;
+  if (timingReports)
+  {
+    Serial.print("D:");
+    Serial.println(fireAt);
+  }
+  return true;
+}
+
+// Fire every scheduled beat whose time has come
+void handleSchedule()
+{
+  unsigned long now = millis();
+
+  for (uint8_t i = 0; i < SCHEDULE_SIZE; i++)
+  {
+    // Signed difference keeps this correct across the millis() rollover
+    if (schedule[i].pending && (long)(now - schedule[i].fireAt) >= 0)
+    {
+      schedule[i].pending = false;
+      applyBeat(schedule[i].level, schedule[i].bpm);
+
+      if (timingReports)
+      {
+        Serial.print("F:");
+        Serial.print(schedule[i].fireAt);
+        Serial.print(':');
+        Serial.println(now);
+      }
+    }
+  }
+}
+
+// Run every task whose deadline has passed. Deadlines advance by whole
+// periods, so a slow loop delays a step but doesn't stretch the ones after.
+void runTasks()
+{
+  unsigned long now = millis();
+
+  for (uint8_t i = 0; i < TASK_COUNT; i++)
+  {
+    Task &task = tasks[i];
+    if ((long)(now - task.due) >= 0)
+    {
+      task.due += task.period;
+      // Far behind (e.g. after a long Serial write) - resync instead of bursting
+      if ((long)(now - task.due) >= 0)
+      {
+        task.due = now + task.period;
+      }
+      task.run();
+    }
+  }
+}
+
+// Set brightness and BPM-dependent decay rate
+void applyBeat(uint16_t level, int bpm)
+{
+  currentLevel = level;
+
+  // Calculate appropriate decay rate based on BPM
+  // Faster music (higher BPM) = faster decay
+  if (bpm > 0)
+  {
+    currentBPM = bpm;
+    // Map BPM range (60-180) to decay range (MAX_DECAY_PERCENT to MIN_DECAY_PERCENT)
+    // in whole percent like v3.1, then to 1/65536ths
+    // Constrain BPM to avoid extreme values
+    long constrainedBPM = constrain(bpm, 60, 180);
+    decayRate = map(constrainedBPM, 60, 180, MAX_DECAY_PERCENT, MIN_DECAY_PERCENT) * 65536UL / 100;
+  }
+
+  // Hold the new level for a full step before decaying
+  tasks[TASK_DECAY].due = millis() + DECAY_DELAY;
+
+  updateLED();
+
+#if DEBUG
+  Serial.print("New level: ");
+  Serial.print(currentLevel);
+  Serial.print(", BPM: ");
+  Serial.print(currentBPM);
+  Serial.print(", Decay Rate: ");
+  Serial.println(decayRate);
+#endif
+}
+
+// One exponential decay step with the dynamically set rate
+void decayStep()
+{
+  if (currentLevel == 0)
+  {
+    return;
+  }
+
+  currentLevel = ((unsigned long)currentLevel * decayRate) >> 16;
+
+  // If brightness is very low, turn off completely (257 levels per PWM step)
+  if (currentLevel < MIN_THRESHOLD * 257U)
+  {
+    currentLevel = 0;
+  }
+
+  updateLED();
+
+#if DEBUG
+  if (currentLevel > 0)
+  {
+    Serial.print("Decay: ");
+    Serial.println(currentLevel);
+  }
+#endif
+}
+
+void latchStats()
+{
+  loopsPerSecond = loopCount;
+  loopCount = 0;
+}
+
+void reportStats()
+{
+  Serial.print("I:");
+  Serial.print(loopsPerSecond);
+  Serial.print(':');
+  Serial.print(droppedBytes);
+  Serial.print(':');
+  Serial.print(badLines);
+  Serial.print(':');
+  Serial.print(rxFull);
+  Serial.print(':');
+  Serial.println(scheduleFull);
+}
+
+// Apply gamma correction and update the LED
+void updateLED()
+{
+  uint8_t index = currentLevel >> 8;
+  uint8_t pwm;
+  if (index == 0)
+  {
+    pwm = pgm_read_byte(&LOW_GAMMA_TABLE[currentLevel]);
+  }
+  else
+  {
+    uint8_t low = pgm_read_byte(&GAMMA_TABLE[index]);
+    uint8_t high = pgm_read_byte(&GAMMA_TABLE[index + 1]);
+    pwm = low + (((high - low) * (currentLevel & 0xFF)) >> 8);
+  }
+  analogWrite(LED_PIN, pwm);
+}
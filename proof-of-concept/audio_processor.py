@@ -1,20 +1,97 @@
 import audioop
+import json
+import os
 import threading
 import time
 import numpy as np
-import pyaudio
 import math
 
+# PyAudio loads PortAudio, which is slow - imported on first start_listening
+pyaudio = None
+
+
+# The rfft gained an out= argument in NumPy 2.0
+_RFFT_HAS_OUT = np.lib.NumpyVersion(np.__version__) >= "2.0.0"
+
+SAMPLE_RATE = 44100              # Capture rate (Hz)
+BLOCK_SIZE = 2048                # Samples per audio block
+SPECTRUM_SIZE = BLOCK_SIZE // 2 + 1
+HISTORY_SIZE = 50                # Blocks of energy/flux history kept
+
+
+def _load_pyaudio():
+    global pyaudio
+    if pyaudio is None:
+        import pyaudio as module
+        pyaudio = module
+    return pyaudio
+
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+
+
+class RingBuffer:
+    """Fixed-size float history that never reallocates.
+
+    Every value is written twice into a buffer of double length, so the most
+    recent values are always one contiguous slice and reads are views, not
+    copies. Supports len(), negative indexing and slicing like the lists it
+    replaces.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity)
+        self._next = 0   # Slot of the next write
+        self._count = 0
+
+    def append(self, value):
+        slot = self._next
+        self._data[slot] = value
+        self._data[slot + self.capacity] = value
+        self._next = slot + 1 if slot + 1 < self.capacity else 0
+        if self._count < self.capacity:
+            self._count += 1
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+    def values(self):
+        """View of the stored values, oldest first"""
+        end = self._next + self.capacity
+        return self._data[end - self._count:end]
+
+    def copy(self):
+        return self.values().copy()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, key):
+        return self.values()[key]
+
 
 class AudioProcessor:
+    # Tunable detection parameters saved in profiles (see tune.py)
+    PROFILE_KEYS = ("sensitivity", "energy_threshold", "min_beat_interval",
+                    "flux_smoothing_window", "energy_smoothing_alpha")
+
     def __init__(self):
         # Audio processing parameters
         self.is_listening = False
         self.beat_detected = False
         self.energy_threshold = 1.1  # Multiplier above average energy
         self.sensitivity = 0.8      # 0.0-1.0, higher is more sensitive
-        self.energy_history = []
-        self.bass_history = []      # Added: track bass energy separately
+        self.energy_history = RingBuffer(HISTORY_SIZE)
+        self.bass_history = RingBuffer(HISTORY_SIZE)      # Added: track bass energy separately
+        self.high_history = RingBuffer(HISTORY_SIZE)
+        self.spectral_flux_history = RingBuffer(HISTORY_SIZE)
+        self.beat_timestamps = RingBuffer(256)  # Enough for 10s of BPM history
+        self.bpm_history = []
+        self.last_bpm_value = None
+        self.last_bpm_calc_time = 0
+        self.last_beat_type = None
+        self.current_beat_position = 0
         self.last_beat_time = 0
         self.min_beat_interval = 0.007  # Seconds between beats
         self.audio = None
@@ -28,6 +105,21 @@ class AudioProcessor:
         self.smoothed_bass = 0.0
         self.smoothed_flux = 0.0
         self.smoothed_high = 0.0
+        
+        # Preallocated work buffers, so a steady-state block allocates nothing
+        # that outlives it (GC pauses on the audio thread cost us beats)
+        self._samples = np.zeros(BLOCK_SIZE)
+        self._fft_out = np.zeros(SPECTRUM_SIZE, dtype=complex)
+        self._flux_diff = np.zeros(SPECTRUM_SIZE)
+        # Double-buffered spectra: one holds the current block, the other the previous
+        self._spectra = np.zeros((2, SPECTRUM_SIZE))
+        self._spectrum_views = (self._spectra[0], self._spectra[1])
+        self._band_views = tuple((spectrum[1:7], spectrum[12:47], spectrum[115:350])
+                                 for spectrum in self._spectrum_views)
+        self._current = 0
+        self._have_prev = False
+        self._continue = None  # (None, paContinue), built once PyAudio is loaded
+        self._init_flux_smoothing()
 
         self.last_anticipation_time = 0  # Track when we last anticipated a beat
         self.anticipation_lockout = False  # Prevent multiple anticipations of the same beat
@@ -46,72 +138,124 @@ class AudioProcessor:
         
         self.callback_fn = callback_fn
         self.is_listening = True
-        self.energy_history = []
-        self.bass_history = []      # Added: clear bass history
-        
-        # Initialize PyAudio
-        self.audio = pyaudio.PyAudio()
-        
-        # Start audio stream
-        self.stream = self.audio.open(
-            format=pyaudio.paInt16,
-            channels=1,
-            rate=44100,
-            input=True,
-            frames_per_buffer=2048,  # Increased for better frequency resolution
-            stream_callback=self._audio_callback
-        )
-        print(f"Using device: {self.audio.get_default_input_device_info()['name']}")
+        self.energy_history.clear()
+        self.bass_history.clear()      # Added: clear bass history
+        
+        # Keep PyAudio and the stream warm between sessions - creating them
+        # enumerates every audio device through PortAudio
+        _load_pyaudio()
+        self._continue = (None, pyaudio.paContinue)
+        if self.audio is None:
+            self.audio = pyaudio.PyAudio()
+        
+        if self.stream is None:
+            # Start audio stream
+            self.stream = self.audio.open(
+                format=pyaudio.paInt16,
+                channels=1,
+                rate=SAMPLE_RATE,
+                input=True,
+                frames_per_buffer=BLOCK_SIZE,
+                stream_callback=self._audio_callback
+            )
+            print(f"Using device: {self.audio.get_default_input_device_info()['name']}")
+        else:
+            self.stream.start_stream()
         return "Audio processing started (bass-enhanced)"
     
     def _audio_callback(self, in_data, frame_count, time_info, status):
-        if not self.is_listening:
-            return (None, pyaudio.paContinue)
-            
+        if self.is_listening:
+            self.process_block(in_data, time.time())
+        return self._continue
+    
+    def _init_flux_smoothing(self):
+        """(Re)build the flux smoothing ring and its cached Hamming windows"""
+        size = self.flux_smoothing_window
+        window = np.hamming(size)
+        self._flux_buffer = np.zeros(size)
+        self._flux_head = 0
+        # Row h is the window rotated to line up with the ring when the
+        # newest value sits at slot h, so no per-block np.roll is needed
+        self._flux_windows = np.array([np.roll(window, h + 1) for h in range(size)])
+        self._flux_windows /= np.sum(window)
+    
+    def _analyse_into(self, in_data, spectrum):
+        """Write the magnitude spectrum of a raw int16 block into spectrum, return energy"""
         # Convert audio data to numpy array
         audio_data = np.frombuffer(in_data, dtype=np.int16)
+        np.copyto(self._samples, audio_data)
         
         # Calculate overall energy (RMS)    
         rms = audioop.rms(in_data, 2)
-        energy = min(1.0, rms / 10000.0)
         
         # Perform frequency analysis using FFT
-        fft_data = np.abs(np.fft.rfft(audio_data))
+        if _RFFT_HAS_OUT:
+            np.fft.rfft(self._samples, out=self._fft_out)
+        else:
+            self._fft_out[:] = np.fft.rfft(self._samples)  # Short-lived temporary
+        np.abs(self._fft_out, out=spectrum)
+        return min(1.0, rms / 10000.0)
+    
+    def analyse_block(self, in_data):
+        """Get overall energy and magnitude spectrum of a raw int16 block"""
+        fft_data = np.empty(SPECTRUM_SIZE)
+        energy = self._analyse_into(in_data, fft_data)
+        return energy, fft_data
+    
+    def process_block(self, in_data, current_time):
+        """Analyse a raw int16 block and run beat detection on it.
         
-        # Store previous FFT data for spectral flux calculation
-        if not hasattr(self, 'prev_fft_data'):
-            self.prev_fft_data = fft_data
-            self.spectral_flux_history = []
+        The spectrum goes straight into the next spectrum buffer, so this
+        path allocates nothing that outlives the call.
+        """
+        spectrum = self._spectrum_views[1 - self._current]
+        energy = self._analyse_into(in_data, spectrum)
+        self.process_spectrum(energy, spectrum, current_time)
+    
+    def process_spectrum(self, energy, fft_data, current_time):
+        """Run beat detection on one analysed block.
+        
+        Kept separate from the FFT so recordings can be replayed offline
+        (see tune.py) with cached spectra and their own timestamps.
+        """
+        # Swap spectrum buffers - the old current one becomes previous
+        prev = self._current
+        current = 1 - prev
+        if fft_data is not self._spectrum_views[current]:
+            np.copyto(self._spectrum_views[current], fft_data)
+        fft_data = self._spectrum_views[current]
+        prev_fft_data = self._spectrum_views[prev]
+        if not self._have_prev:
+            np.copyto(prev_fft_data, fft_data)
+            self._have_prev = True
+        self._current = current
         
         # Calculate spectral flux (sum of differences between current and previous spectrum)
         # This helps detect onsets better than just energy levels
-        flux = np.sum(np.maximum(0, fft_data - self.prev_fft_data))
+        np.subtract(fft_data, prev_fft_data, out=self._flux_diff)
+        np.maximum(self._flux_diff, 0, out=self._flux_diff)
+        flux = self._flux_diff.sum()
         normalized_flux = min(1.0, flux / 5000000.0)
-        self.prev_fft_data = fft_data.copy()
         
         # Apply window smoothing to spectral flux (NEW)
         if self.flux_smoothing_window > 1:
             # Use a small rolling window average
-            if not hasattr(self, 'flux_buffer'):
-                self.flux_buffer = np.zeros(self.flux_smoothing_window)
-            
-            # Roll buffer and add new value
-            self.flux_buffer = np.roll(self.flux_buffer, -1)
-            self.flux_buffer[-1] = normalized_flux
+            head = self._flux_head + 1
+            if head == self.flux_smoothing_window:
+                head = 0
+            self._flux_buffer[head] = normalized_flux
+            self._flux_head = head
             
-            # Apply Hamming window for better weighting
-            window = np.hamming(self.flux_smoothing_window)
-            normalized_flux = np.sum(self.flux_buffer * window) / np.sum(window)
+            # Apply Hamming window for better weighting (pre-normalised)
+            normalized_flux = float(np.dot(self._flux_buffer, self._flux_windows[head]))
         
         # Extract frequency bands (as you already do)
-        bass_bins = fft_data[1:7]
-        bass_energy = min(1.0, np.sum(bass_bins) / 40000000.0)
+        bass_bins, mid_bins, high_bins = self._band_views[current]
+        bass_energy = min(1.0, bass_bins.sum() / 40000000.0)
         
-        mid_bins = fft_data[12:47]
-        mid_energy = min(1.0, np.sum(mid_bins) / 100000000.0)
+        mid_energy = min(1.0, mid_bins.sum() / 100000000.0)
         
-        high_bins = fft_data[115:350]
-        high_energy = min(1.0, np.sum(high_bins) / 50000000.0)
+        high_energy = min(1.0, high_bins.sum() / 50000000.0)
         
         # Apply exponential moving average smoothing (NEW)
         alpha = self.energy_smoothing_alpha
@@ -119,39 +263,26 @@ class AudioProcessor:
         self.smoothed_flux = alpha * normalized_flux + (1 - alpha) * (self.smoothed_flux if self.smoothed_flux > 0 else normalized_flux)
         self.smoothed_high = alpha * high_energy + (1 - alpha) * (self.smoothed_high if self.smoothed_high > 0 else high_energy)
         
-        # Store all relevant history
+        # Store all relevant history (fixed-size rings drop the oldest)
         with self.lock:
             self.energy_history.append(energy)
             self.bass_history.append(self.smoothed_bass)  # Store smoothed values
             self.spectral_flux_history.append(self.smoothed_flux)
-            
-            if not hasattr(self, 'high_history'):
-                self.high_history = []
             self.high_history.append(self.smoothed_high)
-            
-            # Keep histories manageable
-            if len(self.energy_history) > 50:
-                self.energy_history.pop(0)
-            if len(self.bass_history) > 50:
-                self.bass_history.pop(0)
-            if len(self.high_history) > 50:
-                self.high_history.pop(0)
-            if len(self.spectral_flux_history) > 50:
-                self.spectral_flux_history.pop(0)
         
         # Enhanced beat detection with spectral flux
         if len(self.bass_history) >= 5 and len(self.spectral_flux_history) >= 5:
             # Calculate short and long term averages
-            flux_short_term = sum(self.spectral_flux_history[-5:]) / 5
-            flux_long_term = sum(self.spectral_flux_history[-20:]) / 20 if len(self.spectral_flux_history) >= 20 else flux_short_term
+            flux_short_term = self.spectral_flux_history[-5:].sum() / 5
+            flux_long_term = self.spectral_flux_history[-20:].sum() / 20 if len(self.spectral_flux_history) >= 20 else flux_short_term
             
             # Bass detection with enhanced sensitivity
-            bass_short_term = sum(self.bass_history[-5:]) / 5
-            bass_long_term = sum(self.bass_history[-20:]) / 20 if len(self.bass_history) >= 20 else bass_short_term
+            bass_short_term = self.bass_history[-5:].sum() / 5
+            bass_long_term = self.bass_history[-20:].sum() / 20 if len(self.bass_history) >= 20 else bass_short_term
             
             # High frequency detection
-            high_short_term = sum(self.high_history[-5:]) / 5
-            high_long_term = sum(self.high_history[-20:]) / 20 if len(self.high_history) >= 20 else high_short_term
+            high_short_term = self.high_history[-5:].sum() / 5
+            high_long_term = self.high_history[-20:].sum() / 20 if len(self.high_history) >= 20 else high_short_term
             
             # Calculate dynamic thresholds based on recent history
             flux_threshold = flux_long_term * (1.0 - self.sensitivity * 1.5)
@@ -163,8 +294,6 @@ class AudioProcessor:
             bass_beat = self.is_true_onset(self.smoothed_bass, self.bass_history, 1.2) and self.smoothed_bass > bass_threshold
             high_beat = self.is_true_onset(self.smoothed_high, self.high_history, 1.4) and self.smoothed_high > high_threshold
             
-            current_time = time.time()
-            
             # Combined beat detection with spectral flux
             if ((flux_beat or bass_beat or high_beat) and
                 current_time - self.last_beat_time > self.min_beat_interval):
@@ -176,8 +305,6 @@ class AudioProcessor:
                 self.anticipation_lockout = False
 
                 # Add timestamp to beat history for dynamic adjustment
-                if not hasattr(self, 'beat_timestamps'):
-                    self.beat_timestamps = []
                 self.beat_timestamps.append(current_time)
                 
                 # Determine beat type
@@ -197,32 +324,27 @@ class AudioProcessor:
                 # Add debug info about the beat type
                 self.last_beat_type = beat_type
                 
+                # Add to rhythm context before the callback, so predictions
+                # made from it (calculate_next_beat_time) include this beat
+                self.rhythm_context.add_beat(current_time, energy_val, beat_type)
+                
+                # Update current beat position
+                self.current_beat_position = self.rhythm_context.current_position - 1  # 0-3 instead of 1-4
+                
                 # Call the callback
                 if self.callback_fn:
                     try:
                         self.callback_fn(energy_val)
                     except Exception as e:
                         print(f"Callback error: {e}")
-                
-                # After detecting a beat, add to rhythm context
-                if hasattr(self, 'rhythm_context'):
-                    self.rhythm_context.add_beat(current_time, energy_val, beat_type)
-                    
-                    # Update current beat position
-                    if hasattr(self.rhythm_context, 'beat_positions') and self.rhythm_context.beat_positions:
-                        self.current_beat_position = self.rhythm_context.beat_positions[-1][1] - 1  # 0-3 instead of 1-4
     
         # Reset thresholds if no beats for too long
-        current_time = time.time()
-        if hasattr(self, 'last_beat_time') and current_time - self.last_beat_time > 8.0:
+        if current_time - self.last_beat_time > 8.0:
             # Reset to default sensitivity after long silence
             self.energy_threshold = 1.1 - (self.sensitivity * 1.5)
             
             # Also clear beat timestamp history to reset BPM detection
-            if hasattr(self, 'beat_timestamps'):
-                self.beat_timestamps = []
-
-        return (None, pyaudio.paContinue)
+            self.beat_timestamps.clear()
     
     def stop_listening(self):
         """Stop audio capture and processing"""
@@ -231,9 +353,18 @@ class AudioProcessor:
             
         self.is_listening = False
         
-        # Stop and close the stream
+        # Pause the stream but keep it open for the next session
         if self.stream:
             self.stream.stop_stream()
+            
+        return "Audio processing stopped"
+    
+    def close(self):
+        """Stop listening and release the audio device"""
+        self.stop_listening()
+        
+        # Close the stream
+        if self.stream:
             self.stream.close()
             self.stream = None
             
@@ -241,8 +372,6 @@ class AudioProcessor:
         if self.audio:
             self.audio.terminate()
             self.audio = None
-            
-        return "Audio processing stopped"
     
     def set_sensitivity(self, value):
         """Set beat detection sensitivity (0.0-1.0).
@@ -267,9 +396,9 @@ class AudioProcessor:
             return False
         
         # Get recent values and calculate local stats
-        recent = np.array(history[-5:])
-        local_mean = np.mean(recent)
-        local_std = np.std(recent)
+        recent = history[-5:]
+        local_mean = recent.mean()
+        local_std = recent.std()
         
         # Calculate rate of change
         if len(history) > 5:
@@ -295,8 +424,51 @@ class AudioProcessor:
         with self.lock:
             self.flux_smoothing_window = max(1, min(7, window_size))  # Limit window size
             self.energy_smoothing_alpha = max(0.3, min(0.9, ema_alpha))  # Limit alpha range
+            self._init_flux_smoothing()
             return f"Smoothing set to window={self.flux_smoothing_window}, alpha={self.energy_smoothing_alpha:.1f}"
 
+    def get_profile(self):
+        """Get the current detection parameters as a dict"""
+        with self.lock:
+            return {key: getattr(self, key) for key in self.PROFILE_KEYS}
+
+    def apply_profile(self, profile):
+        """Set detection parameters from a dict (missing keys are left alone).
+
+        Raises TypeError, ValueError or OverflowError, with nothing changed,
+        if a value isn't a finite number.
+        """
+        with self.lock:
+            current = {key: getattr(self, key) for key in self.PROFILE_KEYS}
+            current.update((key, profile[key]) for key in self.PROFILE_KEYS if key in profile)
+            # Same limits as set_sensitivity() and set_smoothing()
+            sensitivity = max(0.0, min(1.0, float(current["sensitivity"])))
+            energy_threshold = max(0.0, float(current["energy_threshold"]))
+            min_beat_interval = max(0.0, float(current["min_beat_interval"]))
+            window = max(1, min(7, int(current["flux_smoothing_window"])))
+            alpha = max(0.3, min(0.9, float(current["energy_smoothing_alpha"])))
+
+            self.sensitivity = sensitivity
+            self.energy_threshold = energy_threshold
+            self.min_beat_interval = min_beat_interval
+            self.flux_smoothing_window = window
+            self.energy_smoothing_alpha = alpha
+            self._init_flux_smoothing()
+
+    def load_profile(self, name):
+        """Load a profile saved by tune.py, by path or by name from profiles/"""
+        path = name
+        if not os.path.exists(path):
+            path = os.path.join(PROFILE_DIR, name if name.endswith(".json") else name + ".json")
+        try:
+            with open(path) as f:
+                profile = json.load(f)
+            self.apply_profile(profile.get("params", profile))
+        except (OSError, AttributeError, TypeError, ValueError, OverflowError) as e:
+            return f"Could not load profile {name}: {e}"
+        return f"Loaded profile {os.path.basename(path)}: " + ", ".join(
+            f"{key}={value:g}" for key, value in self.get_profile().items())
+
     def adjust_sensitivity_dynamically(self):
         """Dynamically adjust sensitivity based on audio characteristics and BPM"""
         try:
@@ -313,12 +485,8 @@ class AudioProcessor:
                 bass_history_copy = self.bass_history[-20:].copy()
                 high_history_copy = self.high_history[-20:].copy()
                 
-                if hasattr(self, 'beat_timestamps'):
-                    beat_timestamps_copy = self.beat_timestamps.copy()
-                    last_beat_time_copy = self.last_beat_time
-                else:
-                    beat_timestamps_copy = []
-                    last_beat_time_copy = 0
+                beat_timestamps_copy = self.beat_timestamps.copy()
+                last_beat_time_copy = self.last_beat_time
             
             # Release lock before expensive calculations
             
@@ -389,9 +557,8 @@ class AudioProcessor:
         """Detect the BPM of the current audio stream"""
         # Caching - avoid recalculating BPM multiple times in quick succession
         current_time = time.time()
-        if hasattr(self, 'last_bpm_calc_time') and current_time - self.last_bpm_calc_time < 0.1:
-            if hasattr(self, 'last_bpm_value'):
-                return self.last_bpm_value
+        if current_time - self.last_bpm_calc_time < 0.1 and self.last_bpm_value is not None:
+            return self.last_bpm_value
         
         # Lock handling
         if not safe_mode:
@@ -399,7 +566,7 @@ class AudioProcessor:
         
         try:
             # Check for beat timestamps
-            if not hasattr(self, 'beat_timestamps') or len(self.beat_timestamps) < 5:  # Increased min beats
+            if len(self.beat_timestamps) < 5:  # Increased min beats
                 return None
                 
             # Make a copy of timestamps data
@@ -465,9 +632,6 @@ class AudioProcessor:
                 adjusted_bpm = instantaneous_bpm
                 
             # Store in history
-            if not hasattr(self, 'bpm_history'):
-                self.bpm_history = []
-            
             self.bpm_history.append(adjusted_bpm)
             if len(self.bpm_history) > 5:
                 self.bpm_history.pop(0)
@@ -490,7 +654,7 @@ class AudioProcessor:
 
     def calculate_next_beat_time(self):
         """Calculate next beat with psychological timing model"""
-        if not hasattr(self, 'last_beat_time') or not hasattr(self, 'last_bpm_value'):
+        if self.last_bpm_value is None:
             return None
             
         beat_interval = 60.0 / self.last_bpm_value
@@ -499,100 +663,272 @@ class AudioProcessor:
         next_beat_time = self.last_beat_time + beat_interval
         
         # Apply psychological adjustments if we have rhythm context
-        if hasattr(self, 'rhythm_context') and self.rhythm_context.pattern_confidence > 0.4:
-            # Adjust based on detected pattern - strong beats come slightly earlier
-            if self.rhythm_context.current_pattern:
-                # Extract current position in the pattern
-                if hasattr(self, 'current_beat_position'):
-                    position = (self.current_beat_position + 1) % len(self.rhythm_context.current_pattern)
-                    
-                    # Apply micro-timing based on position
-                    # Downbeats (first beat) often anticipated slightly
-                    if position == 0:  # Downbeat
-                        next_beat_time -= 0.015  # 15ms early anticipation
-                    # Upbeats (beats 2 and 4 in 4/4) slightly delayed
-                    elif position in [1, 3]:
-                        next_beat_time += 0.010  # 10ms delay
+        if self.rhythm_context.beat_count >= 4:
+            # Weight the micro-timing by how likely each role is for the next beat
+            p_down, p_back = self.rhythm_context.next_beat_probabilities()
+            # Downbeats (first beat) often anticipated slightly
+            next_beat_time -= 0.015 * p_down  # Up to 15ms early anticipation
+            # Upbeats (beats 2 and 4 in 4/4) slightly delayed
+            next_beat_time += 0.010 * p_back  # Up to 10ms delay
         
         return next_beat_time
 
 class RhythmContext:
-    """Analyze and predict rhythmic patterns based on psychological models"""
+    """Track bar position and meter with an online HMM over beat phase.
+
+    Each hidden state is a (meter, phase) pair, phase 0 being the downbeat.
+    Every beat advances the phase by one, with a small chance of switching
+    meter, and beat accents (energy and beat type) weight the states by how
+    downbeat-like they are. Once the beat period has settled, onsets between
+    beats are ignored. All state lives in fixed-size arrays, so an update is
+    O(states) regardless of how long we've listened.
+    """
+    METERS = (3, 4)              # Beats per bar we consider
+    METER_SWITCH_PROB = 0.02     # Chance per beat that the meter changes
+    ACCENT_GAIN = 1.2            # How strongly accents separate strong/weak beats
+    MIN_BEAT_GAP = 0.2           # Beats closer than this are merged (seconds)
+    MAX_GAP_BEATS = 8            # Longer gaps than this reset the bar position
+    OFF_BEAT_TOLERANCE = 0.25    # Phase error (in periods) beyond which an onset is off the grid
+    MAX_OFF_BEATS = 3            # Off-grid onsets in a row before the grid is re-anchored
+
+    # How much each beat type suggests an accented (strong) beat
+    TYPE_ACCENT = {"KICK": 1.0, "BASS": 0.6, "FLUX": 0.0, "HIGH": -0.6}
+
     def __init__(self):
-        self.beat_strengths = []  # Store beat strength history 
-        self.beat_positions = []  # Store beat positions in bar (1.0-4.0)
-        self.pattern_confidence = 0.0  # Confidence in detected pattern
-        self.current_pattern = None
-        self.downbeat_energy = 1.0  # Energy multiplier for downbeats
-        self.max_pattern_length = 8  # Maximum beats to consider for pattern
-        
+        self.max_pattern_length = 8  # Beats kept in the history ring
+
+        # State layout: meters are stored back to back, phase-major within each
+        meters, phases = [], []
+        for meter in self.METERS:
+            meters.extend([meter] * meter)
+            phases.extend(range(meter))
+        self._state_meter = np.array(meters)
+        self._state_phase = np.array(phases)
+        self.n_states = len(meters)
+
+        # prev_state[s] is the state that advances into s on the next beat
+        self._prev_state = np.arange(self.n_states)
+        offset = 0
+        for meter in self.METERS:
+            idx = np.arange(meter)
+            self._prev_state[offset + idx] = offset + (idx - 1) % meter
+            offset += meter
+        self._downbeat_states = np.flatnonzero(self._state_phase == 0)
+        self._meter_masks = [self._state_meter == m for m in self.METERS]
+
+        # Accent weight per state: 1 = downbeat, 0.5 = secondary strong beat
+        # (beat 3 of 4/4), 0 = weak beat
+        self._state_accent = np.where(self._state_phase == 0, 1.0, 0.0)
+        self._state_accent[(self._state_meter == 4) & (self._state_phase == 2)] = 0.5
+        # Backbeats (2 and 4 in 4/4) tend to sit slightly late
+        self._state_backbeat = ((self._state_meter == 4) &
+                                (self._state_phase % 2 == 1)).astype(float)
+
+        # Preallocated work buffers
+        self._prior = self._initial_prior()
+        self._belief = self._prior.copy()
+        self._predicted = np.empty(self.n_states)
+        self._likelihood = np.empty(self.n_states)
+
+        # Beat history ring: timestamp, bar position (1-based), downbeat prob
+        self.beat_times = np.zeros(self.max_pattern_length)
+        self.beat_positions = np.zeros(self.max_pattern_length)
+        self.beat_downbeat_probs = np.zeros(self.max_pattern_length)
+        self._head = 0
+        self.beat_count = 0
+
+        self.last_beat_time = None
+        self.last_onset_time = None
+        self.beat_period = None      # Median of recent beat intervals (seconds)
+        # Period samples from beats on the grid, so one bad interval (e.g. an
+        # off-beat at the start) is outvoted instead of locking in a wrong period
+        self._intervals = np.zeros(self.max_pattern_length)
+        self._interval_head = 0
+        self._interval_count = 0
+        # Intervals between all onsets, on the grid or not, to notice a
+        # tempo change the grid would otherwise reject
+        self._onset_intervals = np.zeros(self.max_pattern_length)
+        self._onset_head = 0
+        self._onset_count = 0
+        self._period_settled = False
+        self._off_beats = 0          # Off-grid onsets since the last beat
+        self.mean_energy = 0.0       # Running mean of beat energy
+
+        # Published estimates
+        self.current_position = 1    # Most likely bar position (1-based)
+        self.current_meter = 4
+        self.downbeat_probability = 0.0
+        self.meter_confidence = 0.0  # 0 = meters equally likely, 1 = certain
+        self.pattern_confidence = 0.0  # Posterior of the most likely state
+
+    def _initial_prior(self):
+        """Uniform over meters, with the first beat favoured as a downbeat"""
+        prior = np.where(self._state_phase == 0, 3.0, 1.0)
+        for mask in self._meter_masks:
+            prior[mask] /= prior[mask].sum()
+        return prior / prior.sum()
+
+    def _advance(self):
+        """Move the belief forward by one beat (prediction step)"""
+        np.take(self._belief, self._prev_state, out=self._predicted)
+        # Leak a little mass from each meter into the downbeat of the others
+        switch = self.METER_SWITCH_PROB
+        n_meters = len(self.METERS)
+        for i, mask in enumerate(self._meter_masks):
+            leaked = self._predicted[mask].sum() * switch
+            self._predicted[mask] *= 1.0 - switch
+            share = leaked / (n_meters - 1)
+            for j, down in enumerate(self._downbeat_states):
+                if j != i:
+                    self._predicted[down] += share
+        self._belief, self._predicted = self._predicted, self._belief
+
+    def _add_interval(self, interval):
+        """Record one beat period sample and refresh the estimate"""
+        self._intervals[self._interval_head] = interval
+        self._interval_head = (self._interval_head + 1) % len(self._intervals)
+        self._interval_count = min(self._interval_count + 1, len(self._intervals))
+        self.beat_period = float(np.median(self._intervals[:self._interval_count]))
+
+    def _gaps_on_grid(self, period):
+        """How many recent onset gaps are a whole number of periods"""
+        beats = self._onset_intervals / period
+        whole = np.round(beats)
+        return int(np.count_nonzero((whole >= 1) & (np.abs(beats - whole) <= self.OFF_BEAT_TOLERANCE)))
+
+    def _add_onset_interval(self, interval):
+        """Record the gap since the previous onset; settle or re-settle the period"""
+        self._onset_intervals[self._onset_head] = interval
+        self._onset_head = (self._onset_head + 1) % len(self._onset_intervals)
+        self._onset_count = min(self._onset_count + 1, len(self._onset_intervals))
+        if self._onset_count < len(self._onset_intervals):
+            return
+
+        # Off-beats split a beat into shorter gaps, and missed beats join
+        # beats into longer ones, but at least half the gaps should still be
+        # whole periods. If the period no longer fits, the tempo has changed:
+        # take the longest gap that does fit as the new period.
+        half = len(self._onset_intervals) / 2
+        if self._period_settled and self._gaps_on_grid(self.beat_period) >= half:
+            return
+        for period in np.sort(self._onset_intervals)[::-1]:
+            if self._gaps_on_grid(period) >= half:
+                break
+        else:
+            period = np.median(self._onset_intervals)
+        self._intervals[:] = period
+        self._interval_head = 0
+        self._interval_count = len(self._intervals)
+        self.beat_period = float(period)
+        self._period_settled = True
+
+    def _reset_period(self):
+        self.beat_period = None
+        self._interval_count = 0
+        self._onset_count = 0
+        self._period_settled = False
+
     def add_beat(self, timestamp, energy, beat_type):
-        """Add a beat to the rhythm context"""
-        # Calculate position in rhythmic structure (estimate)
-        if len(self.beat_strengths) > 0:
-            # Estimate beat position based on timing
-            last_time = self.beat_positions[-1][0]
-            interval = timestamp - last_time
-            
-            # If interval is close to a reasonable beat duration (0.2-1.0 sec)
-            if 0.2 < interval < 1.0:
-                # Calculate position within a standard 4/4 bar
-                bar_progress = ((interval * 4.0) % 4.0) + 1.0
-                position = min(4.0, round(bar_progress))
+        """Add a beat to the rhythm context.
+
+        Once the period has settled, onsets off the beat grid (e.g. an
+        off-beat hi-hat) are ignored: they neither move the bar position nor
+        count towards the period.
+        """
+        steps = 1
+        if self.last_beat_time is not None:
+            interval = timestamp - self.last_beat_time
+            if interval < self.MIN_BEAT_GAP:
+                # Same beat detected twice (e.g. KICK followed by FLUX)
+                return
+            onset_interval = timestamp - self.last_onset_time
+            self.last_onset_time = timestamp
+            if self.MIN_BEAT_GAP <= onset_interval < 1.5:
+                self._add_onset_interval(onset_interval)
+
+            if self._period_settled:
+                beats = interval / self.beat_period
+                steps = int(round(beats))
+                off_grid = steps == 0 or abs(beats - steps) > self.OFF_BEAT_TOLERANCE
+                if off_grid and steps <= self.MAX_GAP_BEATS:
+                    self._off_beats += 1
+                    if self._off_beats < self.MAX_OFF_BEATS:
+                        return
+                    # The grid is anchored on an off-beat - restart the bar
+                    # position from this onset
+                    self._belief[:] = self._prior
+                    steps = 0
+                elif interval / steps < 1.5:
+                    self._add_interval(interval / steps)
             else:
-                # If interval is unusual, assume it's position 1 (downbeat)
-                position = 1.0
+                # Still settling: take every onset as a beat
+                if interval < 1.5:
+                    self._add_interval(interval)
+                if self.beat_period is not None:
+                    steps = max(1, int(round(interval / self.beat_period)))
+
+            if steps > self.MAX_GAP_BEATS:
+                # Lost track during a break - start over from a downbeat guess
+                # and let the next song settle its own period
+                self._belief[:] = self._prior
+                self._reset_period()
+                steps = 0
+        self.last_beat_time = timestamp
+        self.last_onset_time = timestamp
+        self._off_beats = 0
+
+        for _ in range(steps):
+            self._advance()
+
+        # Accent evidence: louder than usual and bass-heavy means strong beat
+        if self.mean_energy <= 0:
+            self.mean_energy = energy
+        relative = energy / (self.mean_energy + 1e-6) - 1.0
+        self.mean_energy = 0.9 * self.mean_energy + 0.1 * energy
+        evidence = 3.0 * relative + self.TYPE_ACCENT.get(beat_type, 0.0)
+        p_accent = 1.0 / (1.0 + math.exp(-evidence))
+
+        # Update step: L = 1 +/- gain * (p_accent - 0.5) depending on accent weight
+        np.multiply(self._state_accent, 2.0, out=self._likelihood)
+        self._likelihood -= 1.0
+        self._likelihood *= self.ACCENT_GAIN * (p_accent - 0.5)
+        self._likelihood += 1.0
+        self._belief *= self._likelihood
+        total = self._belief.sum()
+        if total <= 0:
+            self._belief[:] = self._prior
         else:
-            # First beat is assumed to be beat 1 (downbeat)
-            position = 1.0
-            
-        self.beat_strengths.append((timestamp, energy, beat_type))
-        self.beat_positions.append((timestamp, position))
-        
-        if len(self.beat_strengths) > self.max_pattern_length:
-            self.beat_strengths.pop(0)
-            self.beat_positions.pop(0)
-            
-        # Update pattern confidence
-        self._detect_pattern()
-        
-    def _detect_pattern(self):
-        """Detect repeating rhythmic patterns"""
-        # Need at least 4 beats to detect patterns
-        if len(self.beat_strengths) < 4:
-            self.pattern_confidence = 0.0
-            return
-        
-        # Get beat types and positions
-        types = [b[2] for b in self.beat_strengths]
-        positions = [p[1] for p in self.beat_positions]
-        energies = [b[1] for b in self.beat_strengths]
-        
-        # Check for 4-beat pattern
-        if len(types) >= 8:
-            type_match = sum(1 for i in range(4) if types[i] == types[i+4])
-            position_match = sum(1 for i in range(4) if positions[i] == positions[i+4])
-            
-            # Calculate confidence based on how many elements match
-            confidence = (type_match + position_match) / 8.0
-            if confidence > 0.6:
-                self.pattern_confidence = confidence
-                self.current_pattern = types[0:4]
-                return
-        
-        # Check for 2-beat pattern
-        if len(types) >= 4:
-            type_match = sum(1 for i in range(2) if types[i] == types[i+2])
-            position_match = sum(1 for i in range(2) if positions[i] == positions[i+2])
-            
-            confidence = (type_match + position_match) / 4.0
-            if confidence > 0.5:
-                self.pattern_confidence = confidence
-                self.current_pattern = types[0:2]
-                return
-        
-        # No clear pattern - gradually reduce confidence
-        self.pattern_confidence = max(0.0, self.pattern_confidence - 0.1)
+            self._belief /= total
+
+        self._publish()
+
+        slot = self._head
+        self.beat_times[slot] = timestamp
+        self.beat_positions[slot] = self.current_position
+        self.beat_downbeat_probs[slot] = self.downbeat_probability
+        self._head = (slot + 1) % self.max_pattern_length
+        self.beat_count += 1
+
+    def _publish(self):
+        """Refresh the public estimates from the current belief"""
+        best = int(np.argmax(self._belief))
+        self.current_position = int(self._state_phase[best]) + 1
+        self.current_meter = int(self._state_meter[best])
+        self.pattern_confidence = float(self._belief[best])
+        self.downbeat_probability = float(self._belief[self._downbeat_states].sum())
+
+        meter_probs = [self._belief[mask].sum() for mask in self._meter_masks]
+        chance = 1.0 / len(self.METERS)
+        self.meter_confidence = float((max(meter_probs) - chance) / (1.0 - chance))
+
+    def next_beat_probabilities(self):
+        """Probability that the next beat is a downbeat and a backbeat"""
+        # The next beat is a downbeat if we're on the last beat of a bar
+        last_beat = self._state_phase == self._state_meter - 1
+        p_down = float(self._belief[last_beat].sum())
+        # ...and a backbeat if the state it advances into is one
+        p_back = float(np.dot(self._belief[self._prev_state], self._state_backbeat))
+        return p_down, p_back
 
 # For testing
 if __name__ == "__main__":
@@ -609,7 +945,7 @@ if __name__ == "__main__":
         bpm = processor.detect_bpm()
         
         # Visual indicator showing beat type
-        beat_type = processor.last_beat_type if hasattr(processor, 'last_beat_type') else "BEAT"
+        beat_type = processor.last_beat_type or "BEAT"
         bar = "█" * int(brightness * 20)
         print(f"{beat_type}! [{bar:<20}] {brightness:.2f}" + (f" BPM:{bpm:.1f}" if bpm else ""))
         
@@ -650,7 +986,7 @@ if __name__ == "__main__":
                 print(f"Dynamic adjustment: {result}")
                 
                 # Add detailed metrics
-                if hasattr(processor, 'bass_history') and processor.bass_history:
+                if processor.bass_history:
                     bass_mean = sum(processor.bass_history[-10:]) / 10
                     variability = np.std(processor.bass_history[-10:]) / (bass_mean + 0.001)
                     print(f"  Metrics: bass_mean={bass_mean:.3f}, variability={variability:.3f}")
@@ -665,21 +1001,16 @@ if __name__ == "__main__":
                 time_to_beat = next_beat_time - current_time
                 
                 # Determine anticipation window based on rhythm context
-                if hasattr(processor, 'current_beat_position') and processor.current_beat_position == 0:
-                    # Downbeat (first beat of bar) - wider anticipation window
-                    anticipation_window = 0.15  # 150ms
-                    anticipation_brightness = 0.7  # Stronger anticipation
-                else:
-                    # Regular beat - standard window
-                    anticipation_window = 0.1  # 100ms
-                    anticipation_brightness = 0.5  # Normal anticipation
+                # Likely downbeats (first beat of bar) get a wider, stronger anticipation
+                p_down, _ = processor.rhythm_context.next_beat_probabilities()
+                anticipation_window = 0.1 + 0.05 * p_down  # 100-150ms
+                anticipation_brightness = 0.5 + 0.2 * p_down
                 
-                # Apply pattern confidence
-                if hasattr(processor, 'rhythm_context'):
-                    # Higher confidence = earlier anticipation
-                    anticipation_window *= (1.0 + processor.rhythm_context.pattern_confidence * 0.5)
-                    # Higher confidence = stronger anticipation
-                    anticipation_brightness *= (1.0 + processor.rhythm_context.pattern_confidence * 0.2)
+                # Apply meter confidence
+                # Higher confidence = earlier anticipation
+                anticipation_window *= (1.0 + processor.rhythm_context.meter_confidence * 0.5)
+                # Higher confidence = stronger anticipation
+                anticipation_brightness *= (1.0 + processor.rhythm_context.meter_confidence * 0.2)
                 
                 if 0 < time_to_beat < anticipation_window:
                     # Calculate anticipation brightness based on distance to beat
@@ -687,7 +1018,7 @@ if __name__ == "__main__":
                     fade_factor = 1.0 - (time_to_beat / anticipation_window)
                     brightness = anticipation_brightness * fade_factor
                     
-                    print(f"Groove anticipation: {time_to_beat*1000:.0f}ms to beat, confidence: {processor.rhythm_context.pattern_confidence:.2f}")
+                    print(f"Groove anticipation: {time_to_beat*1000:.0f}ms to beat, downbeat: {p_down:.2f}, meter confidence: {processor.rhythm_context.meter_confidence:.2f}")
                     on_beat(brightness)  # Trigger with calculated brightness
                     
                     # Lock out further anticipations until the next actual beat or timeout
@@ -702,6 +1033,6 @@ if __name__ == "__main__":
     
     except KeyboardInterrupt:
         arduino.send_value_with_bpm(0, 0)  # Send zero to Arduino on exit
-        processor.stop_listening()
+        processor.close()
         arduino.close()
         print("Stopped")
\ No newline at end of file
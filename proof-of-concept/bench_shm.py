@@ -0,0 +1,119 @@
+"""
+Beat detection jitter: in-process analysis vs the shared-memory analysis process.
+
+A synthetic capture thread delivers int16 blocks on the real audio schedule
+(2048 samples at 44.1kHz) while background threads keep the GIL busy, like
+serial writes, effects and the REPL do in the app. For every detected beat
+we record how long after its block was captured the beat callback ran.
+Spread in that delay is what the lights show as jitter.
+
+  - in-process: the capture callback runs AudioProcessor.process_block itself
+  - shm:        the capture callback copies the block into the shared ring and
+                the beat arrives back from the analysis process
+
+No audio device needed. Usage: python bench_shm.py [--seconds 20] [--load 3]
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from audio_processor import AudioProcessor, BLOCK_SIZE, SAMPLE_RATE
+from shm_analysis import SharedMemoryAnalyzer
+from synthetic_audio import make_blocks
+
+BLOCK_PERIOD = BLOCK_SIZE / SAMPLE_RATE
+
+
+def gil_load(stop):
+    """Pure-Python busy work that holds the GIL between switch intervals"""
+    while not stop.is_set():
+        sum(i * i for i in range(2000))
+        "".join(f"B:{i / 100:.2f}:120\n" for i in range(50))
+
+
+def capture(blocks, deliver):
+    """Deliver blocks on the audio clock; each is stamped with its due time.
+
+    A real capture callback also has to wait for the GIL before it runs,
+    so the delay from the due time is part of what we measure.
+    """
+    start = time.time() + 0.1
+    for i, block in enumerate(blocks):
+        due = start + i * BLOCK_PERIOD
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        deliver(block, due)
+
+
+def run_mode(name, blocks, load_threads):
+    latencies = []
+    block_time = [0.0]
+
+    def on_beat(energy):
+        latencies.append(time.time() - block_time[0])
+
+    if name == "in-process":
+        processor = AudioProcessor()
+        processor.callback_fn = on_beat
+
+        def deliver(block, due):
+            block_time[0] = due
+            processor.process_block(block, due)
+    else:
+        processor = SharedMemoryAnalyzer()
+        processor._start_worker()
+        processor.callback_fn = lambda energy: latencies.append(
+            time.time() - processor.last_beat_time)
+        processor.is_listening = True
+        deliver = processor.push_block
+
+    stop = threading.Event()
+    load = [threading.Thread(target=gil_load, args=(stop,), daemon=True)
+            for _ in range(load_threads)]
+    for thread in load:
+        thread.start()
+    try:
+        capture(blocks, deliver)
+        time.sleep(0.5)  # Let the last events arrive
+    finally:
+        stop.set()
+        for thread in load:
+            thread.join()
+
+    health = processor.health() if name == "shm" else None
+    if name == "shm":
+        processor.close()
+    return np.array(latencies) * 1000, health
+
+
+def report(name, latencies, health):
+    if not len(latencies):
+        print(f"  {name:<11} no beats detected")
+        return
+    print(f"  {name:<11} {len(latencies):4d} beats  "
+          f"mean {latencies.mean():6.2f}  jitter(std) {latencies.std():6.2f}  "
+          f"p95 {np.percentile(latencies, 95):6.2f}  max {latencies.max():6.2f}")
+    if health:
+        print(f"              {health}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared-memory analysis jitter benchmark")
+    parser.add_argument("--seconds", type=int, default=20, help="Length of the synthetic track")
+    parser.add_argument("--load", type=int, default=3, help="GIL-heavy background threads")
+    args = parser.parse_args()
+
+    blocks = make_blocks(args.seconds)
+    for load in sorted({0, args.load}):
+        print(f"Capture-to-beat-callback delay in ms, {load} load threads:")
+        for name in ("in-process", "shm"):
+            latencies, health = run_mode(name, blocks, load)
+            report(name, latencies, health)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Startup benchmark for the LED controller.
+
+Measures:
+  - import time of each Python module the app uses (fresh interpreter each run)
+  - time to first prompt of the app binary, run under a pty like a terminal
+  - time from "music" to the first analysed audio block, for the first
+    (cold) session and a second (warm) one reusing the audio backend
+
+Usage: python bench_startup.py [--app ./main] [--repeat 5] [--no-audio]
+"""
+
+import argparse
+import os
+import pty
+import select
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODULES = ["serial_handler", "callbacks", "clock_sync", "audio_processor"]
+
+
+def import_time(module, repeat):
+    """Median seconds to import a module in a fresh interpreter"""
+    code = (f"import time; t = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - t)")
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", code], cwd=HERE,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+def time_to_prompt(app, timeout=30.0):
+    """Seconds until the app prints its "> " prompt, or None"""
+    master, slave = pty.openpty()
+    start = time.perf_counter()
+    process = subprocess.Popen([app], cwd=HERE, stdin=slave, stdout=slave,
+                               stderr=subprocess.DEVNULL, close_fds=True)
+    os.close(slave)
+
+    output = b""
+    elapsed = None
+    try:
+        while time.perf_counter() - start < timeout:
+            ready, _, _ = select.select([master], [], [], 0.1)
+            if ready:
+                try:
+                    chunk = os.read(master, 4096)
+                except OSError:
+                    break  # App exited (e.g. no Arduino connected)
+                if not chunk:
+                    break
+                output += chunk
+                if b"> " in output:
+                    elapsed = time.perf_counter() - start
+                    os.write(master, b"exit\n")
+                    break
+            elif process.poll() is not None:
+                break
+    finally:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        os.close(master)
+
+    if elapsed is None:
+        tail = output.decode(errors="replace").strip().splitlines()[-1:] or ["no output"]
+        print(f"  No prompt from {app}: {tail[0]}")
+    return elapsed
+
+
+def time_to_first_block(processor, timeout=5.0):
+    """Seconds from start_listening to the first analysed block, or None"""
+    first_block = threading.Event()
+    process_spectrum = processor.process_spectrum
+
+    def wrapped(*args):
+        first_block.set()
+        return process_spectrum(*args)
+
+    # The audio callback looks the method up on the instance each block
+    processor.process_spectrum = wrapped
+    start = time.perf_counter()
+    processor.start_listening(None)
+    got_block = first_block.wait(timeout)
+    elapsed = time.perf_counter() - start
+    processor.stop_listening()
+    del processor.process_spectrum
+    return elapsed if got_block else None
+
+
+def fmt(seconds):
+    return "n/a" if seconds is None else f"{seconds * 1000:8.1f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark")
+    parser.add_argument("--app", default=os.path.join(HERE, "main"), help="App binary")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement")
+    parser.add_argument("--no-audio", action="store_true", help="Skip the audio device test")
+    args = parser.parse_args()
+
+    print("Import time (median of fresh interpreters):")
+    for module in MODULES:
+        print(f"  {module:<16} {fmt(import_time(module, args.repeat))}")
+
+    print("\nTime to first prompt:")
+    if os.path.exists(args.app):
+        runs = [time_to_prompt(args.app) for _ in range(args.repeat)]
+        runs = [r for r in runs if r is not None]
+        print(f"  {os.path.basename(args.app):<16} {fmt(statistics.median(runs) if runs else None)}")
+    else:
+        print(f"  {args.app} not found - build it first")
+
+    if args.no_audio:
+        return
+
+    print("\n'music' to first analysed block:")
+    start = time.perf_counter()
+    from audio_processor import AudioProcessor
+    processor = AudioProcessor()
+    print(f"  import + init    {fmt(time.perf_counter() - start)}")
+    try:
+        print(f"  cold session     {fmt(time_to_first_block(processor))}")
+        warm = [time_to_first_block(processor) for _ in range(args.repeat)]
+        warm = [w for w in warm if w is not None]
+        print(f"  warm session     {fmt(statistics.median(warm) if warm else None)}")
+    except Exception as e:
+        print(f"  Audio test failed: {e}")
+    finally:
+        processor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,4 +13,33 @@ def create_beat_callback(serial_handler):
             serial_handler.send_value(fade_val)
             
         threading.Timer(0.1, fade).start()
-    return on_beat
\ No newline at end of file
+    return on_beat
+
+def create_scheduled_beat_callback(serial_handler, audio_processor, clock_sync, lead_time=0.03):
+    """Beat callback that schedules the predicted next beat on the device clock.
+
+    Detected beats are already late by the time they reach the Arduino, so each
+    beat also queues the predicted next one at its device time. A detected beat
+    that the schedule already covered is not sent again. Requires Protocol >= v3.1.
+    """
+    import time
+    state = {"scheduled_time": 0.0}
+
+    def on_beat(energy):
+        brightness = min(1.0, energy * 1.5)  # Amplify for visibility
+        bpm = audio_processor.detect_bpm()
+        now = time.time()
+
+        # Only light up immediately if no scheduled beat landed close to this one
+        if abs(now - state["scheduled_time"]) > 0.06:
+            print(f"Beat! Setting LED to {brightness:.2f}")
+            serial_handler.send_value_with_bpm(brightness, bpm)
+
+        # Queue the predicted next beat if there's enough time to get it there
+        next_time = audio_processor.calculate_next_beat_time()
+        if next_time and next_time - now > lead_time and next_time != state["scheduled_time"]:
+            device_time = clock_sync.to_device(next_time)
+            if device_time is not None:
+                serial_handler.send_scheduled(brightness, device_time, bpm)
+                state["scheduled_time"] = next_time
+    return on_beat
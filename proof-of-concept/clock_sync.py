@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class ClockSync:
+    """Estimates the mapping between host time and the Arduino's millis().
+
+    Works like a tiny NTP: each ping records the host time before sending and
+    after the reply, and assumes the device sampled millis() half way through.
+    Only the fastest round trips are trusted, and with enough history a line
+    is fitted through them so crystal drift is tracked too. Requires
+    Protocol >= v3.1.
+    """
+
+    def __init__(self, serial_handler, clock=time.time, window=32):
+        self.serial_handler = serial_handler
+        self.clock = clock  # Must match the clock beat times are taken from
+        self.samples = deque(maxlen=window)  # (host_mid, device_ms, rtt)
+        self.lock = threading.Lock()
+        self._ping_lock = threading.Lock()  # Background and manual pings don't interleave
+        self.seq = 0
+
+        # Current estimate: device_ms = ref_device + (host - ref_host) * 1000 * rate
+        self.ref_host = None
+        self.ref_device = None
+        self.rate = 1.0
+        self.rtt = None           # Best recent round trip (seconds)
+        self.uncertainty = None   # Worst case offset error (seconds)
+
+        self._thread = None
+        self._running = False
+
+    def is_synced(self):
+        return self.ref_host is not None
+
+    def measure(self, timeout=0.2):
+        """Send a single sync ping and record the sample. Returns RTT or None."""
+        with self._ping_lock:
+            self.seq = (self.seq + 1) % 10000
+            seq = self.seq
+
+            t0 = self.clock()
+            if not self.serial_handler.send_line(f"S:{seq}"):
+                return None
+
+            # Skip stale replies from pings that timed out earlier
+            prefix = f"S:{seq}:"
+            line = self.serial_handler.wait_for_line(prefix, timeout)
+            t1 = self.clock()
+        if line is None:
+            return None
+
+        try:
+            device_ms = int(line[len(prefix):])
+        except ValueError:
+            return None
+
+        rtt = t1 - t0
+        with self.lock:
+            self.samples.append(((t0 + t1) / 2, device_ms, rtt))
+            self._fit()
+        return rtt
+
+    def sync(self, count=16, interval=0.01):
+        """Run a burst of pings and return a status string"""
+        replies = 0
+        for _ in range(count):
+            if self.measure() is not None:
+                replies += 1
+            time.sleep(interval)
+
+        if not self.is_synced():
+            return "Clock sync failed (no replies - is firmware v3.1 loaded?)"
+        return (f"Clock synced ({replies}/{count} replies): "
+                f"RTT {self.rtt * 1000:.2f}ms, uncertainty ±{self.uncertainty * 1000:.2f}ms, "
+                f"drift {(self.rate - 1.0) * 1e6:+.0f}ppm")
+
+    def _fit(self):
+        """Refit the host-to-device mapping from the fastest samples"""
+        samples = np.array(self.samples)
+        host, device, rtt = samples[:, 0], samples[:, 1], samples[:, 2]
+
+        # Slow round trips have a less certain midpoint - keep the fast ones
+        best_rtt = np.min(rtt)
+        good = rtt <= best_rtt * 1.5 + 0.0005
+        host, device = host[good], device[good]
+
+        ref_host = host[-1]
+        offsets = device - (host - ref_host) * 1000.0
+
+        # Need a few seconds of history before drift is measurable
+        if len(host) >= 4 and host[-1] - host[0] > 5.0:
+            rate, _ = np.polyfit((host - ref_host) * 1000.0, device, 1)
+            # Arduino clocks are within ~0.5% - anything else is a bad fit
+            if abs(rate - 1.0) < 0.005:
+                self.rate = rate
+                offsets = device - (host - ref_host) * 1000.0 * rate
+
+        self.ref_host = ref_host
+        self.ref_device = float(np.median(offsets))
+        self.rtt = best_rtt
+        # Midpoint error is at most half the round trip, plus millis() resolution
+        self.uncertainty = best_rtt / 2 + 0.001
+
+    def to_device(self, host_time):
+        """Convert a host time (seconds) to device time (millis)"""
+        with self.lock:
+            if self.ref_host is None:
+                return None
+            return int(round(self.ref_device + (host_time - self.ref_host) * 1000.0 * self.rate))
+
+    def to_host(self, device_ms):
+        """Convert a device time (millis) to host time (seconds)"""
+        with self.lock:
+            if self.ref_host is None:
+                return None
+            return self.ref_host + (device_ms - self.ref_device) / (1000.0 * self.rate)
+
+    def start(self, interval=2.0):
+        """Keep the estimate fresh with a ping every interval seconds"""
+        if self._running:
+            return
+        self._running = True
+
+        def run():
+            while self._running:
+                self.measure()
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
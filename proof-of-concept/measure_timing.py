@@ -0,0 +1,159 @@
+"""
+Measure how accurately light changes land on the Arduino.
+
+Compares immediate "B:" commands (sent at the moment they should happen)
+against "F:" commands scheduled ahead of time on the device clock. The
+firmware timestamps every applied change with millis(). After the run those
+are mapped back to host time with the final clock fit (offset and drift), so
+both modes are measured the same way, sync error included:
+
+    error = host time actually applied - host time intended
+
+Requires Protocol >= v3.1 (arduino-test/arduino-v3-1).
+
+With --flood, also streams "B:" commands at a fixed rate and reads the
+firmware's loop rate and dropped-input counters before and after, to find
+how fast the host can push updates. Requires Protocol >= v3.2.
+
+Usage: python measure_timing.py [--port /dev/ttyACM0] [--count 50] [--lead 0.1]
+                                [--flood 500] [--flood-seconds 5]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from clock_sync import ClockSync
+from serial_handler import SerialHandler
+
+
+def summarize(name, errors_ms):
+    """Print timing error statistics in milliseconds"""
+    if not errors_ms:
+        print(f"{name}: no reports received")
+        return
+    errors = np.array(errors_ms)
+    print(f"{name} ({len(errors)} samples):")
+    print(f"  mean {np.mean(errors):+.2f}ms  std {np.std(errors):.2f}ms")
+    print(f"  p50 |err| {np.percentile(np.abs(errors), 50):.2f}ms  "
+          f"p95 |err| {np.percentile(np.abs(errors), 95):.2f}ms  "
+          f"max |err| {np.max(np.abs(errors)):.2f}ms")
+
+
+def host_errors(clock, events):
+    """Errors in ms for (intended host time, applied device ms) pairs"""
+    return [(clock.to_host(applied) - intended) * 1000 for intended, applied in events]
+
+
+def measure_immediate(handler, clock, count, interval):
+    """Send "B:" commands now and see when the device applied them"""
+    events = []
+    for _ in range(count):
+        intended = time.time()
+        handler.send_value_with_bpm(0.5, 120)
+        line = handler.wait_for_line("A:", timeout=0.5)
+        if line is not None:
+            events.append((intended, int(line[2:])))
+        clock.measure()  # Pings between commands feed the final fit
+        time.sleep(interval)
+    return events
+
+
+def measure_scheduled(handler, clock, count, interval, lead):
+    """Schedule "F:" commands lead seconds ahead and see when they fired"""
+    events = []
+    for _ in range(count):
+        intended = time.time() + lead
+        handler.send_scheduled(0.5, clock.to_device(intended), 120)
+        line = handler.wait_for_line("F:", timeout=lead + 0.5)
+        if line is not None:
+            _, _, fired_ms = line.split(":")
+            events.append((intended, int(fired_ms)))
+        clock.measure()
+        time.sleep(interval)
+    return events
+
+
+def measure_flood(handler, rate, seconds):
+    """Stream "B:" commands at rate per second, with firmware counters before and after"""
+    before = handler.request_stats()
+    if before is None:
+        return None
+
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    sent = 0
+    while sent * interval < seconds:
+        delay = start + sent * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        handler.send_value_with_bpm(0.5 + 0.5 * (sent % 2), 120)
+        sent += 1
+    elapsed = time.perf_counter() - start
+    time.sleep(1.1)  # Let loops_per_sec cover a full second after the stream
+    after = handler.request_stats()
+    if after is None:
+        return None
+    return {"rate": rate, "sent": sent, "elapsed": elapsed, "before": before, "after": after}
+
+
+def summarize_flood(flood):
+    """Print flood test results"""
+    if flood is None:
+        print("Flood: no stats reply (is firmware v3.2 loaded?)")
+        return
+    before, after = flood["before"], flood["after"]
+    print(f"Flood: {flood['sent']} commands in {flood['elapsed']:.2f}s "
+          f"({flood['sent'] / flood['elapsed']:.0f}/s, requested {flood['rate']}/s)")
+    print(f"  firmware loops/s {before['loops_per_sec']} before, {after['loops_per_sec']} after")
+    for key in ("dropped_bytes", "bad_lines", "rx_full"):
+        print(f"  {key:<14} +{after[key] - before[key]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure light timing error")
+    parser.add_argument("--port", action="append", help="Serial port (repeatable)")
+    parser.add_argument("--count", type=int, default=50, help="Commands per mode")
+    parser.add_argument("--interval", type=float, default=0.2, help="Seconds between commands")
+    parser.add_argument("--lead", type=float, default=0.1, help="How far ahead to schedule (seconds)")
+    parser.add_argument("--flood", type=int, help="Also stream B: commands at this rate (per second)")
+    parser.add_argument("--flood-seconds", type=float, default=5.0, help="Length of the flood test")
+    args = parser.parse_args()
+
+    handler = SerialHandler()
+    success, msg = handler.connect(args.port)
+    print(msg)
+    if not success:
+        return
+
+    # Keep every ping of the run, so the final fit covers all of it
+    clock = ClockSync(handler, window=32 + 2 * args.count)
+    print(clock.sync(count=32))
+    if not clock.is_synced():
+        handler.close()
+        return
+
+    flood = None
+    handler.send_line("R:1")
+    try:
+        immediate = measure_immediate(handler, clock, args.count, args.interval)
+        scheduled = measure_scheduled(handler, clock, args.count, args.interval, args.lead)
+        if args.flood:
+            handler.send_line("R:0")  # Keep reports out of the way of the stats reply
+            flood = measure_flood(handler, args.flood, args.flood_seconds)
+    finally:
+        handler.send_line("R:0")
+        handler.send_value_with_bpm(0, 120)  # Turn the LED off; B: rejects BPM 0
+        handler.close()
+
+    print(f"\nSync: RTT {clock.rtt * 1000:.2f}ms, uncertainty ±{clock.uncertainty * 1000:.2f}ms, "
+          f"drift {(clock.rate - 1.0) * 1e6:+.0f}ppm")
+    summarize("Immediate (B:)", host_errors(clock, immediate))
+    summarize(f"Scheduled (F:, {args.lead * 1000:.0f}ms lead)", host_errors(clock, scheduled))
+    if args.flood:
+        summarize_flood(flood)
+
+
+if __name__ == "__main__":
+    main()
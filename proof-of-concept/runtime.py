@@ -0,0 +1,326 @@
+"""
+Event-loop runtime for the LED controller.
+
+Unlike the blocking REPL in main.mojo, commands, effects and music mode run
+concurrently on one asyncio loop:
+  - effects (pulse) are tasks - a new effect, a brightness value or "stop"
+    cancels the running one
+  - serial writes are awaited on a dedicated writer thread, so a slow port
+    never stalls the loop
+  - commands come from stdin and, optionally, a Unix socket so external show
+    controllers can push cues, e.g.
+
+        echo "pulse 2 5" | socat - UNIX-CONNECT:/tmp/lights.sock
+
+Effect frames are scheduled on absolute deadlines from the effect's start,
+so command load can delay a frame but never shifts the ones after it.
+
+With --shm, beat detection runs in a separate analysis process fed over a
+shared-memory ring (see shm_analysis.py); "health" reports the rings.
+
+Usage: python runtime.py [--socket /tmp/lights.sock] [--port /dev/ttyACM0] [--shm]
+   or: ./main --async [socket path]
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import stat
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from callbacks import create_beat_callback, create_scheduled_beat_callback
+from serial_handler import SerialHandler
+
+FRAME_INTERVAL = 0.03  # Seconds between effect frames (same as the REPL pulse)
+
+HELP = """Commands:
+  <float>  - Set value (0.0-1.0) for LED brightness
+  music    - Start music-reactive mode
+  stop     - Stop music-reactive mode and any running effect
+  sens <value> - Set music sensitivity (0.0-1.0)
+  profile <name> - Load detection profile saved by tune.py
+  pulse <speed> [duration] - Run pulse effect (speed in Hz)
+  sync     - Sync clocks and schedule predicted beats (firmware v3.1)
+  health   - Show analysis process ring buffer health (--shm)
+  beat     - Trigger a test beat
+  exit     - Exit the program"""
+
+
+class LightRuntime:
+    """Runs commands, effects and music mode on one asyncio event loop."""
+
+    def __init__(self, serial_handler, shm=False):
+        self.serial_handler = serial_handler
+        self.shm = shm  # Run beat detection in a separate process
+        self.audio_processor = None  # Created on first use (numpy, PyAudio)
+        self.clock_sync = None
+        self.on_beat = create_beat_callback(serial_handler)
+        self.effect_task = None
+        self._effect_lock = asyncio.Lock()  # Cancel-and-replace is one step
+        self.stopping = None
+        # One writer thread keeps serial writes ordered and off the loop
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="serial")
+
+    async def send_value(self, value):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self.serial_handler.send_value, value)
+
+    async def _blocking(self, fn, *args):
+        """Run a slow call (device open, clock sync, imports) off the loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _get_audio_processor(self):
+        if self.audio_processor is None:
+            def load():
+                if self.shm:
+                    from shm_analysis import SharedMemoryAnalyzer
+                    return SharedMemoryAnalyzer()
+                from audio_processor import AudioProcessor
+                return AudioProcessor()
+            self.audio_processor = await self._blocking(load)
+        return self.audio_processor
+
+    async def _cancel_effect_locked(self):
+        if self.effect_task and not self.effect_task.done():
+            self.effect_task.cancel()
+            await asyncio.gather(self.effect_task, return_exceptions=True)
+            return True
+        return False
+
+    async def cancel_effect(self):
+        """Cancel the running effect, if any. Returns True if one was running.
+
+        Waits for it to finish so its final write lands before anything new.
+        """
+        async with self._effect_lock:
+            return await self._cancel_effect_locked()
+
+    async def start_effect(self, coro):
+        # Under the lock, so concurrent commands can't both start an effect
+        # and leave one that nothing references
+        async with self._effect_lock:
+            await self._cancel_effect_locked()
+            self.effect_task = asyncio.ensure_future(coro)
+
+    async def pulse(self, speed, duration=10.0):
+        """Pulse with a sine wave at speed Hz for duration seconds."""
+        print("Running pulse effect for", duration, "seconds")
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        frame = 0
+        try:
+            while frame * FRAME_INTERVAL < duration:
+                deadline = start + frame * FRAME_INTERVAL
+                delay = deadline - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                # Brightness follows the frame's deadline, not when we woke up
+                angle = (deadline - start) * speed * math.tau
+                await self.send_value((math.sin(angle) + 1) / 2)  # Map to 0.0-1.0
+
+                # If we fell behind, skip the missed frames rather than drift
+                behind = math.ceil((loop.time() - start) / FRAME_INTERVAL)
+                frame = max(frame + 1, behind)
+            print("Pulse effect completed")
+        except asyncio.CancelledError:
+            print("Pulse effect interrupted")
+            raise
+        finally:
+            await self.send_value(0.0)  # Turn off LED
+
+    async def handle_command(self, command):
+        """Run a command and return the response text"""
+        command = command.strip()
+        if not command:
+            return ""
+
+        if command.lower() == "exit":
+            self.stopping.set()
+            return "Exiting"
+
+        if command == "help":
+            return HELP
+
+        if command == "beat":
+            await self._blocking(self.on_beat, 0.8)
+            return "Manually triggering beat..."
+
+        if command == "music":
+            await self.cancel_effect()
+            processor = await self._get_audio_processor()
+            return str(await self._blocking(processor.start_listening, self.on_beat))
+
+        if command == "stop":
+            responses = []
+            if await self.cancel_effect():
+                responses.append("Effect stopped")
+            if self.audio_processor is not None:
+                # PortAudio's stop blocks until the stream has drained
+                responses.append(await self._blocking(self.audio_processor.stop_listening))
+            return "\n".join(responses) or "Nothing running"
+
+        if command == "health":
+            if not self.shm:
+                return "Health is only available with --shm"
+            if self.audio_processor is None:
+                return "Analysis process not started"
+            return self.audio_processor.health()
+
+        if command == "sync":
+            if self.clock_sync is None:
+                from clock_sync import ClockSync
+                self.clock_sync = ClockSync(self.serial_handler)
+            response = await self._blocking(self.clock_sync.sync)
+            if self.clock_sync.is_synced():
+                self.clock_sync.start()
+                processor = await self._get_audio_processor()
+                self.on_beat = create_scheduled_beat_callback(
+                    self.serial_handler, processor, self.clock_sync)
+                response += "\nScheduled beats enabled (restart music to apply)"
+            return response
+
+        if command.startswith("sens "):
+            try:
+                value = float(command[5:])
+            except ValueError:
+                return "Invalid sensitivity value"
+            if not 0.0 <= value <= 1.0:
+                return "Sensitivity must be between 0.0 and 1.0"
+            processor = await self._get_audio_processor()
+            return processor.set_sensitivity(value)
+
+        if command.startswith("profile "):
+            processor = await self._get_audio_processor()
+            return processor.load_profile(command[8:])
+
+        if command.startswith("pulse "):
+            try:
+                parts = command[6:].split()
+                speed = float(parts[0])
+                # Optional duration parameter, default 10 seconds
+                duration = float(parts[1]) if len(parts) > 1 else 10.0
+            except (ValueError, IndexError):
+                return "Invalid format. Use: pulse <speed> [duration]"
+            if speed <= 0:
+                return "Speed must be positive"
+            await self.start_effect(self.pulse(speed, duration))
+            return ""
+
+        # Normal brightness value input - overrides any running effect
+        try:
+            value = float(command)
+        except ValueError:
+            return "Invalid input. Enter a number between 0.0 and 1.0, or type 'help'"
+        if not 0.0 <= value <= 1.0:
+            return "Value must be between 0.0 and 1.0"
+        await self.cancel_effect()
+        await self.send_value(value)
+        return ""
+
+    async def run_command(self, command):
+        """handle_command, with errors reported instead of ending the reader"""
+        try:
+            return await self.handle_command(command)
+        except Exception as e:
+            return f"Error: {e}"
+
+    async def _read_stdin(self, interactive):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        while not self.stopping.is_set():
+            if interactive:
+                print("> ", end="", flush=True)
+            line = await reader.readline()
+            if not line:
+                return  # EOF
+            response = await self.run_command(line.decode(errors="replace"))
+            if response:
+                print(response)
+
+    async def _handle_client(self, reader, writer):
+        """One line per command, one response block per command"""
+        try:
+            while not self.stopping.is_set():
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.run_command(line.decode(errors="replace"))
+                writer.write((response + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=None):
+        """Run until "exit", or until stdin closes when there's no socket"""
+        self.stopping = asyncio.Event()
+        server = None
+        if socket_path:
+            try:
+                mode = os.lstat(socket_path).st_mode
+            except FileNotFoundError:
+                pass
+            else:
+                if not stat.S_ISSOCK(mode):
+                    raise FileExistsError(f"{socket_path} exists and is not a socket")
+                os.unlink(socket_path)  # Stale socket from a previous run
+            server = await asyncio.start_unix_server(self._handle_client, path=socket_path)
+            print(f"Listening for commands on {socket_path}")
+
+        print(HELP)
+        stdin_task = asyncio.ensure_future(self._read_stdin(sys.stdin.isatty()))
+        stop_task = asyncio.ensure_future(self.stopping.wait())
+        await asyncio.wait([stdin_task, stop_task], return_when=asyncio.FIRST_COMPLETED)
+        # Keep serving socket clients after stdin closes (e.g. run as a service)
+        if server is not None and not self.stopping.is_set():
+            await stop_task
+
+        stdin_task.cancel()
+        stop_task.cancel()
+        await self.cancel_effect()
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+            try:
+                os.unlink(socket_path)
+            except FileNotFoundError:
+                pass
+        if self.audio_processor is not None:
+            await self._blocking(self.audio_processor.close)
+        if self.clock_sync is not None:
+            self.clock_sync.stop()
+        self._writer.shutdown(wait=True)
+
+
+def run(serial_handler, socket_path=None, shm=False):
+    """Run the event-loop runtime on a connected SerialHandler"""
+    asyncio.run(LightRuntime(serial_handler, shm).serve(socket_path or None))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event-loop LED controller")
+    parser.add_argument("--socket", help="Also accept commands on this Unix socket")
+    parser.add_argument("--port", action="append", help="Serial port (repeatable)")
+    parser.add_argument("--shm", action="store_true",
+                        help="Run beat detection in a separate process over shared memory")
+    args = parser.parse_args()
+
+    serial_handler = SerialHandler()
+    success, msg = serial_handler.connect(args.port)
+    print(msg)
+    if not success:
+        return
+    try:
+        run(serial_handler, args.socket, args.shm)
+    finally:
+        serial_handler.close()
+        print("Connection closed.")
+
+
+if __name__ == "__main__":
+    main()
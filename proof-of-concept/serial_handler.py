@@ -1,4 +1,6 @@
+import threading
 import time
+from collections import deque
 from typing import List, Optional, Tuple, Union
 
 import serial
@@ -14,6 +16,9 @@ class SerialHandler:
         self.timeout = timeout
         self.ser = None
         self.connected = False
+        self.write_lock = threading.Lock()  # Beat, fade and sync writes come from different threads
+        self.read_lock = threading.Lock()  # Replies are awaited from more than one thread too
+        self.unhandled_lines = deque(maxlen=256)  # Lines skipped by wait_for_line
     
     def connect(self, ports=None) -> Tuple[bool, str]:
         """Try to connect to Arduino on various ports."""
@@ -39,7 +44,8 @@ class SerialHandler:
         
         # Format value with 3 decimal places
         command = f"{value:.3f}\n"
-        self.ser.write(command.encode('utf-8'))
+        with self.write_lock:
+            self.ser.write(command.encode('utf-8'))
         return True
     
     def send_value_with_bpm(self, brightness, bpm=None):
@@ -53,9 +59,82 @@ class SerialHandler:
         else:
             command = f"{brightness:.3f}\n"  # Backward compatible
             
-        self.ser.write(command.encode('utf-8'))
+        with self.write_lock:
+            self.ser.write(command.encode('utf-8'))
         return True
 
+    def send_scheduled(self, brightness, device_time_ms, bpm=None):
+        """Schedule a brightness value to fire at a device time (millis). Requires Protocol >= v3.1."""
+        if not self.connected or not self.ser:
+            return False
+        
+        # millis() is an unsigned long on the Arduino, so wrap like it does
+        command = f"F:{int(device_time_ms) & 0xFFFFFFFF}:{brightness:.3f}:{int(bpm) if bpm else 0}\n"
+        with self.write_lock:
+            self.ser.write(command.encode('utf-8'))
+        return True
+
+    def send_line(self, line):
+        """Send a raw protocol line (newline is added)."""
+        if not self.connected or not self.ser:
+            return False
+        with self.write_lock:
+            self.ser.write(f"{line}\n".encode('utf-8'))
+        return True
+
+    def request_stats(self, timeout=0.5):
+        """Ask the firmware for its loop and input counters. Requires Protocol >= v3.2.
+        
+        Returns a dict, or None if there was no reply.
+        """
+        if not self.send_line("I"):
+            return None
+        line = self.wait_for_line("I:", timeout)
+        if line is None:
+            return None
+        try:
+            values = [int(v) for v in line[2:].split(":")]
+        except ValueError:
+            return None
+        keys = ("loops_per_sec", "dropped_bytes", "bad_lines", "rx_full", "schedule_full")
+        return dict(zip(keys, values))
+
+    def wait_for_line(self, prefix, timeout=0.5):
+        """Read lines until one starts with prefix, or return None on timeout.
+        
+        Lines with other prefixes are kept in unhandled_lines.
+        """
+        if not self.connected or not self.ser:
+            return None
+        
+        # One reader at a time (e.g. the clock sync thread and a manual sync);
+        # a reply read by another waiter is found in unhandled_lines
+        if not self.read_lock.acquire(timeout=timeout):
+            return None
+        try:
+            for i, line in enumerate(self.unhandled_lines):
+                if line.startswith(prefix):
+                    del self.unhandled_lines[i]
+                    return line
+            
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                try:
+                    raw = self.ser.readline()
+                except Exception as e:
+                    print(f"Error reading line: {e}")
+                    return None
+                if not raw:
+                    continue
+                line = raw.decode('utf-8', errors='replace').strip()
+                if line.startswith(prefix):
+                    return line
+                if line:
+                    self.unhandled_lines.append(line)
+            return None
+        finally:
+            self.read_lock.release()
+
     def send_binary_sequence(self, values):
         """Send a sequence of values as binary data without any newlines."""
         if not self.connected or not self.ser:
@@ -102,8 +181,9 @@ class SerialHandler:
         if not self.connected or not self.ser:
             return ""
         try:
-            if self.ser.in_waiting > 0:
-                return self.ser.readline().decode('utf-8').strip()
+            with self.read_lock:
+                if self.ser.in_waiting > 0:
+                    return self.ser.readline().decode('utf-8').strip()
             return ""
         except Exception as e:
             print(f"Error reading line: {e}")
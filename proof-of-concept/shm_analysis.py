@@ -0,0 +1,414 @@
+"""
+Out-of-process beat detection over shared-memory ring buffers.
+
+The PortAudio callback only copies raw int16 blocks into a shared-memory ring;
+a separate analysis process runs the NumPy DSP and beat detection and sends
+compact beat/feature events back over a second ring. DSP no longer competes
+with serial writes, fades and the REPL for the main interpreter's GIL.
+
+    capture (main)  --audio ring-->  analysis process  --event ring-->  callback (main)
+
+SharedMemoryAnalyzer is a drop-in for AudioProcessor as used by main.mojo,
+runtime.py and the callbacks, plus health() for ring fill and overruns.
+The worker comes from a forkserver, never a fork of the (multi-threaded)
+app, and attaches to the rings by name.
+"""
+
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from audio_processor import AudioProcessor, BLOCK_SIZE, SAMPLE_RATE, _load_pyaudio
+
+AUDIO_RECORD = np.dtype([("time", "f8"), ("samples", "i2", (BLOCK_SIZE,))])
+
+# Event kinds
+FEATURES = 0
+BEAT = 1
+BEAT_TYPES = ("BEAT", "KICK", "BASS", "HIGH", "FLUX")
+
+EVENT_RECORD = np.dtype([
+    ("time", "f8"),        # Capture time of the block
+    ("next_beat", "f8"),   # Predicted next beat (NaN if unknown)
+    ("kind", "u1"),
+    ("beat_type", "u1"),   # Index into BEAT_TYPES
+    ("energy", "f4"),      # Beat energy for BEAT, RMS level for FEATURES
+    ("bpm", "f4"),         # NaN if unknown
+    ("downbeat", "f4"),    # Downbeat probability
+    ("bass", "f4"),
+    ("flux", "f4"),
+    ("high", "f4"),
+    ("proc_us", "f4"),     # Analysis time of the block
+])
+
+
+class ShmRing:
+    """Single-producer, single-consumer ring of fixed-size records in shared memory.
+
+    The producer only advances the write count and the consumer only the read
+    count, so no lock is needed. A full ring drops the new record and counts
+    an overrun rather than blocking the producer (the audio thread).
+    """
+    WRITE, READ, OVERRUNS, MAX_FILL = range(4)
+    HEADER_BYTES = 64
+
+    def __init__(self, dtype, capacity):
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=self.HEADER_BYTES + capacity * self.dtype.itemsize)
+        self._map()
+        self._header[:] = 0
+
+    def _map(self):
+        self._header = np.ndarray(self.HEADER_BYTES // 8, dtype=np.int64, buffer=self.shm.buf)
+        self.records = np.ndarray(self.capacity, dtype=self.dtype, buffer=self.shm.buf,
+                                  offset=self.HEADER_BYTES)
+
+    # Pickled by name, so the analysis process attaches to the same memory
+    def __getstate__(self):
+        return {"name": self.shm.name, "dtype": self.dtype, "capacity": self.capacity}
+
+    def __setstate__(self, state):
+        self.dtype = state["dtype"]
+        self.capacity = state["capacity"]
+        self.shm = shared_memory.SharedMemory(name=state["name"])
+        self._map()
+
+    def reserve(self):
+        """Next free record to fill in, or None if the ring is full (counted as an overrun)"""
+        header = self._header
+        if header[self.WRITE] - header[self.READ] >= self.capacity:
+            header[self.OVERRUNS] += 1
+            return None
+        return self.records[header[self.WRITE] % self.capacity]
+
+    def commit(self):
+        """Publish the reserved record"""
+        header = self._header
+        header[self.WRITE] += 1
+        fill = header[self.WRITE] - header[self.READ]
+        if fill > header[self.MAX_FILL]:
+            header[self.MAX_FILL] = fill
+
+    def peek(self):
+        """Oldest unread record, or None if the ring is empty"""
+        header = self._header
+        if header[self.READ] == header[self.WRITE]:
+            return None
+        return self.records[header[self.READ] % self.capacity]
+
+    def release(self):
+        """Mark the peeked record as consumed"""
+        self._header[self.READ] += 1
+
+    def fill(self):
+        return int(self._header[self.WRITE] - self._header[self.READ])
+
+    def stats(self):
+        header = self._header
+        return {
+            "fill": int(header[self.WRITE] - header[self.READ]),
+            "max_fill": int(header[self.MAX_FILL]),
+            "capacity": self.capacity,
+            "written": int(header[self.WRITE]),
+            "read": int(header[self.READ]),
+            "overruns": int(header[self.OVERRUNS]),
+        }
+
+    def close(self, unlink=False):
+        # Views must go before the mapping can be closed
+        self._header = None
+        self.records = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _analysis_worker(audio_ring, event_ring, audio_ready, events_ready, control, stop,
+                     profile, feature_interval):
+    """Analysis process: consume audio blocks, emit beat and feature events"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The main process handles Ctrl+C
+
+    try:
+        _analyse(audio_ring, event_ring, audio_ready, events_ready, control, stop,
+                 profile, feature_interval)
+    finally:
+        audio_ring.close()
+        event_ring.close()
+
+
+def _analyse(audio_ring, event_ring, audio_ready, events_ready, control, stop,
+             profile, feature_interval):
+    processor = AudioProcessor()
+    processor.apply_profile(profile)
+    beat = [None]
+    processor.callback_fn = lambda energy: beat.__setitem__(0, energy)
+    type_codes = {name: code for code, name in enumerate(BEAT_TYPES)}
+    blocks = 0
+
+    while not stop.is_set():
+        # Parameter changes from the main process, e.g. ("apply_profile", (dict,))
+        try:
+            while True:
+                name, args = control.get_nowait()
+                getattr(processor, name)(*args)
+        except queue.Empty:
+            pass
+
+        if not audio_ready.acquire(timeout=0.1):
+            continue
+
+        record = audio_ring.peek()
+        while record is not None:
+            start = time.perf_counter()
+            block_time = float(record["time"])
+            processor.process_block(record["samples"], block_time)
+            audio_ring.release()
+            proc_us = (time.perf_counter() - start) * 1e6
+            blocks += 1
+
+            energy, beat[0] = beat[0], None
+            if energy is not None or blocks % feature_interval == 0:
+                event = event_ring.reserve()
+                if event is not None:
+                    event["time"] = block_time
+                    event["proc_us"] = proc_us
+                    event["bass"] = processor.smoothed_bass
+                    event["flux"] = processor.smoothed_flux
+                    event["high"] = processor.smoothed_high
+                    event["downbeat"] = processor.rhythm_context.downbeat_probability
+                    if energy is not None:
+                        bpm = processor.detect_bpm()
+                        next_beat = processor.calculate_next_beat_time()
+                        event["kind"] = BEAT
+                        event["energy"] = energy
+                        event["beat_type"] = type_codes.get(processor.last_beat_type, 0)
+                        event["bpm"] = bpm if bpm is not None else np.nan
+                        event["next_beat"] = next_beat if next_beat is not None else np.nan
+                    else:
+                        event["kind"] = FEATURES
+                        event["energy"] = processor.energy_history[-1]
+                        event["beat_type"] = 0
+                        event["bpm"] = np.nan
+                        event["next_beat"] = np.nan
+                    event_ring.commit()
+                    events_ready.release()
+
+            record = audio_ring.peek()
+
+
+class SharedMemoryAnalyzer:
+    """AudioProcessor stand-in that runs beat detection in a separate process."""
+
+    def __init__(self, audio_slots=64, event_slots=256, feature_interval=4):
+        self.audio_slots = audio_slots
+        self.event_slots = event_slots
+        self.feature_interval = feature_interval  # Blocks between feature events
+
+        # Holds the detection parameters and formats responses; the worker
+        # gets a copy of every change
+        self.params = AudioProcessor()
+
+        self.is_listening = False
+        self.callback_fn = None
+        self.audio = None
+        self.stream = None
+        self._continue = None
+        self._worker = None
+        self._event_thread = None
+        # Forking the app would copy locks held by its other threads
+        # (serial writer, clock sync, executor) into the worker
+        self._context = multiprocessing.get_context("forkserver")
+
+        # Latest analysis results mirrored from events
+        self.last_beat_time = 0
+        self.last_beat_type = None
+        self.last_bpm_value = None
+        self.next_beat_time = None
+        self.energy_level = 0.0
+        self.downbeat_probability = 0.0
+        self.proc_us_mean = 0.0
+        self.proc_us_max = 0.0
+        self.callback_latency_max = 0.0  # Capture to callback (seconds)
+
+    def _start_worker(self):
+        """Create the rings and start the analysis process (once, kept warm)"""
+        if self._worker is not None:
+            return
+        self.audio_ring = ShmRing(AUDIO_RECORD, self.audio_slots)
+        self.event_ring = ShmRing(EVENT_RECORD, self.event_slots)
+        self._audio_ready = self._context.Semaphore(0)
+        self._events_ready = self._context.Semaphore(0)
+        self._control = self._context.Queue()
+        self._stop = self._context.Event()
+        self._worker = self._context.Process(
+            target=_analysis_worker, name="beat-analysis", daemon=True,
+            args=(self.audio_ring, self.event_ring, self._audio_ready, self._events_ready,
+                  self._control, self._stop, self.params.get_profile(), self.feature_interval))
+        self._worker.start()
+
+        self._event_thread = threading.Thread(target=self._read_events, daemon=True)
+        self._event_thread.start()
+
+    def _read_events(self):
+        """Main-process side: mirror analysis state and fire the beat callback"""
+        while not self._stop.is_set():
+            if not self._events_ready.acquire(timeout=0.1):
+                continue
+            event = self.event_ring.peek()
+            while event is not None:
+                kind = int(event["kind"])
+                block_time = float(event["time"])
+                energy = float(event["energy"])
+                proc_us = float(event["proc_us"])
+                self.downbeat_probability = float(event["downbeat"])
+                if kind == BEAT:
+                    self.last_beat_time = block_time
+                    self.last_beat_type = BEAT_TYPES[int(event["beat_type"])]
+                    bpm = float(event["bpm"])
+                    next_beat = float(event["next_beat"])
+                    self.last_bpm_value = None if np.isnan(bpm) else bpm
+                    self.next_beat_time = None if np.isnan(next_beat) else next_beat
+                else:
+                    self.energy_level = energy
+                self.event_ring.release()
+
+                self.proc_us_mean = 0.95 * self.proc_us_mean + 0.05 * proc_us
+                self.proc_us_max = max(self.proc_us_max, proc_us)
+
+                if kind == BEAT and self.is_listening and self.callback_fn:
+                    self.callback_latency_max = max(self.callback_latency_max,
+                                                    time.time() - block_time)
+                    try:
+                        self.callback_fn(energy)
+                    except Exception as e:
+                        print(f"Callback error: {e}")
+                event = self.event_ring.peek()
+
+    def _capture_callback(self, in_data, frame_count, time_info, status):
+        if self.is_listening:
+            self.push_block(in_data, time.time())
+        return self._continue
+
+    def push_block(self, in_data, capture_time):
+        """Copy a raw int16 block into the audio ring (dropped if the ring is full)"""
+        record = self.audio_ring.reserve()
+        if record is None:
+            return False
+        record["time"] = capture_time
+        record["samples"] = np.frombuffer(in_data, dtype=np.int16)
+        self.audio_ring.commit()
+        self._audio_ready.release()
+        return True
+
+    def start_listening(self, callback_fn=None):
+        """Start audio capture with beat detection in the analysis process"""
+        if self.is_listening:
+            return "Already listening"
+
+        self._start_worker()
+        self.callback_fn = callback_fn
+        self.is_listening = True
+
+        # Same warm PyAudio handling as AudioProcessor.start_listening
+        pyaudio = _load_pyaudio()
+        self._continue = (None, pyaudio.paContinue)
+        if self.audio is None:
+            self.audio = pyaudio.PyAudio()
+        if self.stream is None:
+            self.stream = self.audio.open(
+                format=pyaudio.paInt16,
+                channels=1,
+                rate=SAMPLE_RATE,
+                input=True,
+                frames_per_buffer=BLOCK_SIZE,
+                stream_callback=self._capture_callback
+            )
+            print(f"Using device: {self.audio.get_default_input_device_info()['name']}")
+        else:
+            self.stream.start_stream()
+        return "Audio processing started (analysis process)"
+
+    def stop_listening(self):
+        """Stop audio capture (the analysis process stays warm)"""
+        if not self.is_listening:
+            return "Not listening"
+        self.is_listening = False
+        if self.stream:
+            self.stream.stop_stream()
+        return "Audio processing stopped"
+
+    def close(self):
+        """Stop listening, end the analysis process and free the rings"""
+        if self.stream or self.audio:
+            self.stop_listening()
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            if self.audio:
+                self.audio.terminate()
+                self.audio = None
+        if self._worker is not None:
+            self._stop.set()
+            self._worker.join(timeout=2.0)
+            if self._worker.is_alive():
+                self._worker.terminate()
+            self._event_thread.join(timeout=1.0)
+            self.audio_ring.close(unlink=True)
+            self.event_ring.close(unlink=True)
+            self._worker = None
+
+    def _send_params(self):
+        if self._worker is not None:
+            self._control.put(("apply_profile", (self.params.get_profile(),)))
+
+    def set_sensitivity(self, value):
+        response = self.params.set_sensitivity(value)
+        self._send_params()
+        return response
+
+    def set_smoothing(self, window_size=3, ema_alpha=0.7):
+        response = self.params.set_smoothing(window_size, ema_alpha)
+        self._send_params()
+        return response
+
+    def apply_profile(self, profile):
+        self.params.apply_profile(profile)
+        self._send_params()
+
+    def get_profile(self):
+        return self.params.get_profile()
+
+    def load_profile(self, name):
+        response = self.params.load_profile(name)
+        self._send_params()
+        return response
+
+    def get_energy_level(self):
+        return self.energy_level if self.is_listening else 0.0
+
+    def detect_bpm(self, safe_mode=False):
+        return self.last_bpm_value
+
+    def calculate_next_beat_time(self):
+        return self.next_beat_time
+
+    def health(self):
+        """Ring fill levels, overruns and analysis timing as a status string"""
+        if self._worker is None:
+            return "Analysis process not started"
+        audio = self.audio_ring.stats()
+        events = self.event_ring.stats()
+        return (f"Audio ring {audio['fill']}/{audio['capacity']} (max {audio['max_fill']}), "
+                f"overruns {audio['overruns']}; "
+                f"event ring {events['fill']}/{events['capacity']} (max {events['max_fill']}), "
+                f"overruns {events['overruns']}; "
+                f"{audio['read']} blocks analysed, {self.proc_us_mean:.0f}us avg, {self.proc_us_max:.0f}us max; "
+                f"worst capture-to-callback {self.callback_latency_max * 1000:.1f}ms; "
+                f"worker {'alive' if self._worker.is_alive() else 'DEAD'}")
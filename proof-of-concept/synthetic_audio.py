@@ -0,0 +1,21 @@
+"""
+Synthetic test audio for benchmarks and tests - no audio device needed.
+"""
+
+import numpy as np
+
+from audio_processor import BLOCK_SIZE, SAMPLE_RATE
+
+
+def make_blocks(seconds=20, bpm=128):
+    """Noise with a decaying 60Hz kick on every beat, as raw int16 blocks"""
+    rng = np.random.default_rng(0)
+    signal = rng.normal(0, 300, SAMPLE_RATE * seconds)
+    t = np.arange(3000)
+    kick = 12000 * np.exp(-t / 800) * np.sin(2 * np.pi * 60 * t / SAMPLE_RATE)
+    for beat in np.arange(0.2, seconds - 0.1, 60 / bpm):
+        start = int(beat * SAMPLE_RATE)
+        signal[start:start + len(kick)] += kick
+    samples = np.clip(signal, -32768, 32767).astype(np.int16)
+    return [samples[i:i + BLOCK_SIZE].tobytes()
+            for i in range(0, len(samples) - BLOCK_SIZE + 1, BLOCK_SIZE)]
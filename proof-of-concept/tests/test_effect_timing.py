@@ -0,0 +1,66 @@
+"""
+# Test that effect frames stay on their deadlines under command load
+Pulse frames are due at start + n * FRAME_INTERVAL; commands arriving while
+the effect runs may delay a frame but must not shift the ones after it.
+"""
+import asyncio
+import math
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from runtime import FRAME_INTERVAL, LightRuntime  # noqa: E402
+
+SPEED = 2.0
+DURATION = 1.0
+COMMANDS = 200
+TOLERANCE = 0.015  # How late a frame may land, in seconds
+
+
+class FakeSerialHandler:
+    """Records when each value reaches the port"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes = []
+
+    def send_value(self, value):
+        with self.lock:
+            self.writes.append((time.monotonic(), value))
+        return True
+
+
+async def pulse_under_load(runtime):
+    await runtime.run_command(f"pulse {SPEED} {DURATION}")
+    effect = runtime.effect_task
+    # Commands that are answered without touching the running effect
+    commands = ["help", "health", "bogus", "2.0", "sens x", "pulse 0"]
+    for i in range(COMMANDS):
+        await runtime.run_command(commands[i % len(commands)])
+        await asyncio.sleep(DURATION / COMMANDS)
+    await effect
+
+
+def test_pulse_frames_do_not_drift_under_command_load():
+    handler = FakeSerialHandler()
+    runtime = LightRuntime(handler)
+    try:
+        asyncio.run(pulse_under_load(runtime))
+    finally:
+        runtime._writer.shutdown(wait=True)
+
+    frames = handler.writes[:-1]
+    assert handler.writes[-1][1] == 0.0  # LED turned off at the end
+    assert len(frames) == math.ceil(DURATION / FRAME_INTERVAL)
+
+    start = frames[0][0]
+    for n, (sent, value) in enumerate(frames):
+        # No frame was skipped: brightness follows frame n's deadline
+        expected = (math.sin(n * FRAME_INTERVAL * SPEED * math.tau) + 1) / 2
+        assert math.isclose(value, expected, abs_tol=1e-9)
+
+        lateness = sent - (start + n * FRAME_INTERVAL)
+        assert -TOLERANCE < lateness < TOLERANCE, f"frame {n} off by {lateness * 1000:.1f}ms"
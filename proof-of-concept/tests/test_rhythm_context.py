@@ -0,0 +1,94 @@
+"""
+# Test that the bar-position HMM settles on the right meter and phase
+Beats are fed directly with a downbeat accent (louder KICK on beat 1).
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_processor import RhythmContext  # noqa: E402
+
+PERIOD = 0.5
+
+
+def feed_bars(context, meter, bars, start=0.0, skip=(), period=PERIOD, off_beat=None):
+    """Accented beats for whole bars plus the next downbeat.
+
+    off_beat adds a HIGH onset half a period after that beat of every bar.
+    Returns the bar position tracked at each downbeat.
+    """
+    positions = []
+    for i in range(meter * bars + 1):
+        if i in skip:
+            continue
+        time = start + i * period
+        downbeat = i % meter == 0
+        context.add_beat(time, 1.0 if downbeat else 0.5, "KICK" if downbeat else "FLUX")
+        if downbeat:
+            positions.append(context.current_position)
+        if i % meter == off_beat and i < meter * bars:
+            context.add_beat(time + period / 2, 0.5, "HIGH")
+    return positions
+
+
+@pytest.mark.parametrize("meter", [3, 4])
+def test_settles_on_meter_and_downbeat(meter):
+    context = RhythmContext()
+    feed_bars(context, meter, bars=16)
+
+    assert context.current_meter == meter
+    assert context.current_position == 1
+    assert context.downbeat_probability > 0.9
+    assert context.meter_confidence > 0.8
+
+
+@pytest.mark.parametrize("meter", [3, 4])
+def test_recovers_from_offbeat_first_interval(meter):
+    # A stray off-beat half a period before the music starts must not
+    # lock the period at half its real value
+    context = RhythmContext()
+    context.add_beat(-PERIOD / 2, 0.5, "FLUX")
+    feed_bars(context, meter, bars=16)
+
+    assert context.beat_period == pytest.approx(PERIOD)
+    assert context.current_meter == meter
+    assert context.current_position == 1
+    assert context.downbeat_probability > 0.9
+    assert context.meter_confidence > 0.8
+
+
+def test_missed_beats_keep_the_phase():
+    context = RhythmContext()
+    feed_bars(context, 4, bars=16, skip={9, 22, 35, 46})
+
+    assert context.current_meter == 4
+    assert context.current_position == 1
+    assert context.downbeat_probability > 0.9
+
+
+@pytest.mark.parametrize("meter", [3, 4])
+def test_off_beat_onsets_keep_the_phase(meter):
+    # An off-beat hi-hat in every bar must neither advance the bar position
+    # nor halve the period
+    context = RhythmContext()
+    positions = feed_bars(context, meter, bars=16, off_beat=1)
+
+    assert context.beat_period == pytest.approx(PERIOD)
+    assert positions[-8:] == [1] * 8
+    assert context.current_meter == meter
+    assert context.downbeat_probability > 0.9
+    assert context.meter_confidence > 0.8
+
+
+@pytest.mark.parametrize("period", [0.35, 0.7])
+def test_follows_a_tempo_change(period):
+    context = RhythmContext()
+    feed_bars(context, 4, bars=16)
+    positions = feed_bars(context, 4, bars=16, start=16 * 4 * PERIOD + period, period=period)
+
+    assert context.beat_period == pytest.approx(period)
+    assert positions[-8:] == [1] * 8
+    assert context.downbeat_probability > 0.9
@@ -0,0 +1,57 @@
+"""
+# Test that the audio callback path allocates nothing in steady state
+GC pauses on the audio thread cause missed beats, so after warm-up a block
+must not leave any new allocations behind.
+"""
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_processor import AudioProcessor, BLOCK_SIZE, SAMPLE_RATE  # noqa: E402
+from synthetic_audio import make_blocks  # noqa: E402
+
+
+def run_blocks(processor, blocks, first_index):
+    for i, block in enumerate(blocks, first_index):
+        processor.process_block(block, i * BLOCK_SIZE / SAMPLE_RATE)
+
+
+def test_process_block_has_no_net_allocations():
+    blocks = make_blocks()
+    processor = AudioProcessor()
+    processor.callback_fn = lambda energy: None
+
+    # Warm up: fill every history ring and take a few beats
+    warmup = 250
+    run_blocks(processor, blocks[:warmup], 0)
+    assert processor.beat_timestamps, "test signal should produce beats"
+
+    # Objects replaced every block (e.g. floats stored in attributes) exist
+    # in both snapshots once tracing has settled, so only growth remains
+    tracemalloc.start()
+    try:
+        run_blocks(processor, blocks[warmup:warmup + 50], warmup)
+        before = tracemalloc.take_snapshot()
+        measured = blocks[warmup + 50:]
+        run_blocks(processor, measured, warmup + 50)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    module_filter = [tracemalloc.Filter(True, "*audio_processor.py")]
+    diff = after.filter_traces(module_filter).compare_to(
+        before.filter_traces(module_filter), "lineno")
+    leaked = [stat for stat in diff if stat.size_diff > 0]
+    assert not leaked, f"allocations left behind over {len(measured)} blocks: {leaked}"
+
+
+def test_flux_window_follows_set_smoothing():
+    processor = AudioProcessor()
+    processor.set_smoothing(window_size=5)
+    assert processor._flux_buffer.shape == (5,)
+    assert np.allclose(processor._flux_windows.sum(axis=1), 1.0)
+    run_blocks(processor, make_blocks(seconds=2), 0)
@@ -0,0 +1,331 @@
+"""
+Tune beat detection parameters against a corpus of labelled recordings.
+
+Every recording is replayed through AudioProcessor.process_spectrum for each
+candidate configuration, and the detected beats are matched against the
+reference beat times. Work is spread over all cores with a process pool.
+Spectra only depend on the audio, so they are computed once per file and
+cached on disk - repeated runs and all configurations skip the FFT.
+
+Corpus layout (WAV, 16-bit; reference beats one time in seconds per line,
+extra columns are ignored):
+
+    corpus/track.wav
+    corpus/track.beats        (or track.txt)
+    corpus/house/song.wav     subdirectories are genres and get
+    corpus/house/song.beats   their own preset
+
+The best configuration overall is saved as profiles/default.json and the
+best per genre as profiles/<genre>.json, loadable with
+AudioProcessor.load_profile (or "profile <name>" in the app).
+
+Usage:
+    python tune.py corpus/ --grid
+    python tune.py corpus/ --random 300 --jobs 8
+"""
+
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+import numpy as np
+
+from audio_processor import AudioProcessor, BLOCK_SIZE, PROFILE_DIR, SAMPLE_RATE
+
+TOLERANCE = 0.07    # Seconds either side of a reference beat (MIREX standard)
+CHUNK_SIZE = 16     # Configurations per pool task
+
+PARAM_GRID = {
+    "flux_smoothing_window": [1, 3, 5, 7],
+    "energy_smoothing_alpha": [0.3, 0.5, 0.7, 0.9],
+    "sensitivity": [0.2, 0.5, 0.8],
+    "energy_threshold": [1.0, 1.2, 1.5, 2.0],
+    "min_beat_interval": [0.007, 0.1, 0.25],
+}
+
+# (low, high) for random search - ints are sampled as ints
+PARAM_RANGES = {
+    "flux_smoothing_window": (1, 7),
+    "energy_smoothing_alpha": (0.3, 0.9),
+    "sensitivity": (0.0, 1.0),
+    "energy_threshold": (1.0, 2.5),
+    "min_beat_interval": (0.007, 0.3),
+}
+
+
+def find_recordings(corpus):
+    """Find (wav path, reference path, genre) for every labelled recording"""
+    recordings = []
+    for root, _, files in os.walk(corpus):
+        if os.path.basename(root).startswith("."):
+            continue
+        for name in sorted(files):
+            if not name.lower().endswith(".wav"):
+                continue
+            stem = os.path.join(root, os.path.splitext(name)[0])
+            for ext in (".beats", ".txt"):
+                if os.path.exists(stem + ext):
+                    genre = os.path.relpath(root, corpus)
+                    recordings.append((os.path.join(root, name), stem + ext,
+                                       None if genre == "." else genre))
+                    break
+            else:
+                print(f"Skipping {name}: no .beats or .txt reference")
+    return recordings
+
+
+def load_reference(path):
+    """Load reference beat times (first column, seconds)"""
+    times = []
+    with open(path) as f:
+        for line in f:
+            fields = line.replace(",", " ").split()
+            if fields:
+                try:
+                    times.append(float(fields[0]))
+                except ValueError:
+                    continue  # Header line
+    return np.array(sorted(times))
+
+
+def load_audio(path):
+    """Load a WAV file as mono int16 at SAMPLE_RATE"""
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit WAV is supported")
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        # Linear resampling is plenty for beat detection
+        duration = len(samples) / rate
+        positions = np.arange(int(duration * SAMPLE_RATE)) * (rate / SAMPLE_RATE)
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return samples.astype(np.int16)
+
+
+def cache_spectra(path, cache_dir):
+    """Compute per-block energy and spectra for a file unless already cached.
+
+    Returns the cache file prefix. The key covers the file's identity and the
+    block size, so edited recordings are re-analysed.
+    """
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{BLOCK_SIZE}"
+    prefix = os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest())
+    if os.path.exists(prefix + "_spectra.npy"):
+        return prefix
+
+    samples = load_audio(path)
+    processor = AudioProcessor()
+    n_blocks = len(samples) // BLOCK_SIZE
+    energies = np.empty(n_blocks)
+    spectra = np.empty((n_blocks, BLOCK_SIZE // 2 + 1))
+    for i in range(n_blocks):
+        block = samples[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE]
+        # Same code path as the live callback
+        energies[i], spectra[i] = processor.analyse_block(block.tobytes())
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(prefix + "_energy.npy", energies)
+    np.save(prefix + "_spectra.npy", spectra)
+    return prefix
+
+
+@lru_cache(maxsize=4)
+def load_spectra(prefix):
+    """Memory-map cached spectra (kept per worker process)"""
+    return (np.load(prefix + "_energy.npy"),
+            np.load(prefix + "_spectra.npy", mmap_mode="r"))
+
+
+def replay(energies, spectra, params):
+    """Run the detector over cached blocks and return beat times"""
+    processor = AudioProcessor()
+    processor.apply_profile(params)
+    beats = []
+    processor.callback_fn = lambda energy: beats.append(processor.last_beat_time)
+
+    # Blocks reach the callback once they are fully captured
+    block_time = BLOCK_SIZE / SAMPLE_RATE
+    for i in range(len(energies)):
+        processor.process_spectrum(float(energies[i]), spectra[i], (i + 1) * block_time)
+    return np.array(beats)
+
+
+def match_beats(detected, reference, tolerance=TOLERANCE):
+    """Match each reference beat to the closest unused detection.
+
+    Returns (true positives, false positives, false negatives, signed errors).
+    """
+    used = np.zeros(len(detected), dtype=bool)
+    errors = []
+    for ref in reference:
+        lo = np.searchsorted(detected, ref - tolerance)
+        hi = np.searchsorted(detected, ref + tolerance, side="right")
+        best = None
+        for j in range(lo, hi):
+            if not used[j] and (best is None or abs(detected[j] - ref) < abs(detected[best] - ref)):
+                best = j
+        if best is not None:
+            used[best] = True
+            errors.append(detected[best] - ref)
+    tp = len(errors)
+    return tp, len(detected) - tp, len(reference) - tp, errors
+
+
+def evaluate_chunk(prefix, reference, first_index, configs, tolerance):
+    """Pool task: score a chunk of configurations on one recording"""
+    energies, spectra = load_spectra(prefix)
+    results = []
+    for offset, params in enumerate(configs):
+        detected = replay(energies, spectra, params)
+        tp, fp, fn, errors = match_beats(detected, reference, tolerance)
+        results.append((first_index + offset, tp, fp, fn,
+                        float(np.sum(errors)), float(np.sum(np.abs(errors)))))
+    return results
+
+
+def grid_configs():
+    keys = list(PARAM_GRID)
+    return [dict(zip(keys, values)) for values in itertools.product(*PARAM_GRID.values())]
+
+
+def random_configs(count, seed=None):
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(count):
+        params = {}
+        for key, (low, high) in PARAM_RANGES.items():
+            if isinstance(low, int) and isinstance(high, int):
+                params[key] = rng.randint(low, high)
+            else:
+                params[key] = round(rng.uniform(low, high), 3)
+        configs.append(params)
+    return configs
+
+
+def score(counts):
+    """F-measure, precision, recall and timing errors (ms) from summed counts"""
+    tp, fp, fn, error_sum, abs_error_sum = counts
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f_measure = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    mean_error = error_sum / tp * 1000 if tp else float("nan")
+    mean_abs_error = abs_error_sum / tp * 1000 if tp else float("nan")
+    return f_measure, precision, recall, mean_error, mean_abs_error
+
+
+def save_profile(name, params, scores, n_files):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    f_measure, precision, recall, mean_error, mean_abs_error = scores
+    profile = {
+        "params": params,
+        "f_measure": round(f_measure, 4),
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "mean_error_ms": round(mean_error, 2),
+        "mean_abs_error_ms": round(mean_abs_error, 2),
+        "files": n_files,
+        "tuned": time.strftime("%Y-%m-%d"),
+    }
+    path = os.path.join(PROFILE_DIR, f"{name}.json")
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune beat detection on labelled recordings")
+    parser.add_argument("corpus", help="Directory of .wav files with .beats/.txt references")
+    search = parser.add_mutually_exclusive_group()
+    search.add_argument("--grid", action="store_true", help="Exhaustive grid search (default)")
+    search.add_argument("--random", type=int, metavar="N", help="Random search with N configurations")
+    parser.add_argument("--seed", type=int, help="Random search seed")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Match window (seconds)")
+    parser.add_argument("--cache-dir", help="Spectrum cache (default: <corpus>/.tune_cache)")
+    parser.add_argument("--output", default="tune_results.csv", help="CSV of all results")
+    parser.add_argument("--no-save", action="store_true", help="Don't write profiles")
+    args = parser.parse_args()
+
+    recordings = find_recordings(args.corpus)
+    if not recordings:
+        print("No labelled recordings found")
+        return
+    cache_dir = args.cache_dir or os.path.join(args.corpus, ".tune_cache")
+    configs = random_configs(args.random, args.seed) if args.random else grid_configs()
+    genres = sorted({genre for _, _, genre in recordings if genre})
+    print(f"{len(recordings)} recordings, {len(configs)} configurations, {args.jobs} workers")
+
+    # counts[group][config] = [tp, fp, fn, error_sum, abs_error_sum]
+    groups = [None] + genres
+    counts = {group: np.zeros((len(configs), 5)) for group in groups}
+    files_per_group = {group: 0 for group in groups}
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        # Spectra first, so every configuration reuses them
+        prefixes = list(pool.map(cache_spectra, [path for path, _, _ in recordings],
+                                 itertools.repeat(cache_dir)))
+        print(f"Spectra ready in {time.perf_counter() - start:.1f}s")
+
+        futures = {}
+        for prefix, (_, reference_path, genre) in zip(prefixes, recordings):
+            reference = load_reference(reference_path)
+            files_per_group[None] += 1
+            if genre:
+                files_per_group[genre] += 1
+            for first in range(0, len(configs), CHUNK_SIZE):
+                chunk = configs[first:first + CHUNK_SIZE]
+                future = pool.submit(evaluate_chunk, prefix, reference, first, chunk, args.tolerance)
+                futures[future] = genre
+
+        for done, future in enumerate(as_completed(futures), 1):
+            genre = futures[future]
+            for index, *result in future.result():
+                counts[None][index] += result
+                if genre:
+                    counts[genre][index] += result
+            if done % 50 == 0 or done == len(futures):
+                print(f"  {done}/{len(futures)} tasks ({time.perf_counter() - start:.1f}s)")
+
+    with open(args.output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["group", *PARAM_GRID, "f_measure", "precision", "recall",
+                         "mean_error_ms", "mean_abs_error_ms"])
+        for group in groups:
+            for params, row in zip(configs, counts[group]):
+                writer.writerow([group or "all", *params.values(),
+                                 *(f"{value:.4f}" for value in score(row))])
+    print(f"Results written to {args.output}")
+
+    for group in groups:
+        scores = [score(row) for row in counts[group]]
+        # Ties on F-measure go to the smaller mean absolute timing error
+        ranking = sorted(range(len(configs)), reverse=True,
+                         key=lambda i: (scores[i][0], np.nan_to_num(-scores[i][4], nan=-np.inf)))
+        print(f"\nBest for {group or 'all recordings'} ({files_per_group[group]} files):")
+        for i in ranking[:5]:
+            f_measure, _, _, mean_error, mean_abs_error = scores[i]
+            print(f"  F={f_measure:.3f} err={mean_error:+.1f}ms |err|={mean_abs_error:.1f}ms  {configs[i]}")
+
+        if not args.no_save:
+            best = ranking[0]
+            path = save_profile((group or "default").replace(os.sep, "-"), configs[best], scores[best], files_per_group[group])
+            print(f"  Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
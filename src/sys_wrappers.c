@@ -1,7 +1,34 @@
+#define _GNU_SOURCE // ptsname_r
+#include <stdlib.h>
 #include <unistd.h>
 #include <fcntl.h>
 #include <sys/ioctl.h>
 #include <termios.h>
+#include <linux/serial.h>
+
+// Kernel struct termios2 (asm/termbits.h clashes with termios.h, so it is
+// declared here). Layout for x86, ARM and RISC-V; other archs differ.
+struct serial_termios2
+{
+    tcflag_t c_iflag;
+    tcflag_t c_oflag;
+    tcflag_t c_cflag;
+    tcflag_t c_lflag;
+    cc_t c_line;
+    cc_t c_cc[19];
+    speed_t c_ispeed;
+    speed_t c_ospeed;
+};
+
+#define SERIAL_TCGETS2 _IOR('T', 0x2A, struct serial_termios2)
+#define SERIAL_TCSETS2 _IOW('T', 0x2B, struct serial_termios2)
+
+#ifndef BOTHER
+#define BOTHER 0010000
+#endif
+#ifndef IBSHIFT
+#define IBSHIFT 16
+#endif
 
 // Wrapper functions with unique names that won't conflict
 int serial_open(const char *path, int flags)
@@ -53,4 +80,71 @@ int serial_cfsetispeed(struct termios *termios_p, speed_t speed)
 int serial_cfsetospeed(struct termios *termios_p, speed_t speed)
 {
     return cfsetospeed(termios_p, speed);
-}
\ No newline at end of file
+}
+
+// Custom speeds - any integer baud rate via termios2/BOTHER
+int serial_set_custom_baud(int fd, unsigned int baud)
+{
+    struct serial_termios2 tio;
+    if (ioctl(fd, SERIAL_TCGETS2, &tio) != 0)
+        return -1;
+
+    tio.c_cflag &= ~(CBAUD | (CBAUD << IBSHIFT));
+    tio.c_cflag |= BOTHER | (BOTHER << IBSHIFT);
+    tio.c_ispeed = baud;
+    tio.c_ospeed = baud;
+    return ioctl(fd, SERIAL_TCSETS2, &tio);
+}
+
+// Actual input and output speeds in baud, whichever way they were set
+int serial_get_baud(int fd, unsigned int *ispeed, unsigned int *ospeed)
+{
+    struct serial_termios2 tio;
+    if (ioctl(fd, SERIAL_TCGETS2, &tio) != 0)
+        return -1;
+
+    *ispeed = tio.c_ispeed;
+    *ospeed = tio.c_ospeed;
+    return 0;
+}
+
+// ASYNC_LOW_LATENCY via TIOCSSERIAL. Fails on drivers without serial_struct
+// support (e.g. ptys, some USB adapters)
+int serial_set_low_latency(int fd, int enable)
+{
+    struct serial_struct ss;
+    if (ioctl(fd, TIOCGSERIAL, &ss) != 0)
+        return -1;
+
+    if (enable)
+        ss.flags |= ASYNC_LOW_LATENCY;
+    else
+        ss.flags &= ~ASYNC_LOW_LATENCY;
+    return ioctl(fd, TIOCSSERIAL, &ss);
+}
+
+// 1 if ASYNC_LOW_LATENCY is set, 0 if not, -1 if unsupported
+int serial_get_low_latency(int fd)
+{
+    struct serial_struct ss;
+    if (ioctl(fd, TIOCGSERIAL, &ss) != 0)
+        return -1;
+
+    return (ss.flags & ASYNC_LOW_LATENCY) != 0;
+}
+
+// Open a pseudo-terminal pair for testing. Returns the master fd and writes
+// the slave path (to open like a real port) into name
+int serial_openpty(char *name, size_t len)
+{
+    int master = posix_openpt(O_RDWR | O_NOCTTY);
+    if (master < 0)
+        return -1;
+
+    if (grantpt(master) != 0 || unlockpt(master) != 0 || ptsname_r(master, name, len) != 0)
+    {
+        close(master);
+        return -1;
+    }
+    return master;
+}